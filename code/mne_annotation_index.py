@@ -0,0 +1,253 @@
+import os
+import re
+
+import numpy as np
+
+# ------------------------------------------------------------------
+# Indexed annotation / event store
+# ------------------------------------------------------------------
+# mne.events_from_annotations() walks the string descriptions of every
+# annotation on every call. AnnotationIndex does the string work once:
+#
+#   - annotations sorted by onset (seconds) with their sample index,
+#   - descriptions interned as integer codes (``descriptions[code]``),
+#   - per-condition position arrays (and their onsets) into the sorted arrays.
+#
+# Queries are then binary searches on numeric arrays:
+#
+#   index = load_or_build_index(raw, 's17_1.set')   # cached as s17_1-annot-500Hz.npz
+#   index.select('Encoding', tmin=60., tmax=120.)   # positions of matching events
+#   index.overlaps_bad('Encoding', -0.2, 0.8)       # epochs touching BAD segments
+#   events, event_id = index.to_events()            # == mne.events_from_annotations(raw)
+
+# Same default as mne.events_from_annotations(): skip 'bad*' and 'edge*'.
+DEFAULT_REGEXP = r'^(?![Bb][Aa][Dd]|[Ee][Dd][Gg][Ee]).*$'
+
+# Saved with every index; caches of other versions are rebuilt (2: onsets
+# count from the first sample also without a meas_date).
+CACHE_VERSION = 2
+
+
+class AnnotationIndex:
+    """
+    Sorted, interned view of a set of annotations. Build it with from_raw()
+    or read_annotation_index(); ``onset`` (s, relative to the first sample),
+    ``sample``, ``duration`` and ``code`` are parallel arrays sorted by onset.
+    """
+
+    def __init__(self, onset, duration, sample, code, descriptions, sfreq, first_samp=0):
+        order = np.argsort(onset, kind='stable')
+        self.onset = np.asarray(onset, float)[order]
+        self.duration = np.asarray(duration, float)[order]
+        self.sample = np.asarray(sample, np.int64)[order]
+        self.code = np.asarray(code, np.int32)[order]
+        self.descriptions = list(descriptions)
+        self.sfreq = float(sfreq)
+        self.first_samp = int(first_samp)
+        self._codes = {desc: k for k, desc in enumerate(self.descriptions)}
+        # Positions (into the sorted arrays) and onsets of every condition.
+        by_code = np.argsort(self.code, kind='stable')
+        bounds = np.searchsorted(self.code[by_code], np.arange(len(self.descriptions) + 1))
+        self.positions = [by_code[bounds[k]:bounds[k + 1]] for k in range(len(self.descriptions))]
+        self._onsets = [self.onset[pos] for pos in self.positions]
+        self._bad = None
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Index ``raw.annotations`` (samples as events_from_annotations)."""
+        annot = raw.annotations
+        descriptions, code = np.unique(np.asarray(annot.description, str), return_inverse=True)
+        sample = raw.time_as_index(annot.onset, use_rounding=True, origin=annot.orig_time)
+        if annot.orig_time is not None:
+            sample = sample + raw.first_samp
+        # Onsets relative to the first sample: raw.annotations count from the
+        # start of the acquisition (meas_date, or sample 0 without one).
+        onset = annot.onset - raw.first_samp / raw.info['sfreq']
+        return cls(onset, annot.duration, sample, code, descriptions.tolist(),
+                   raw.info['sfreq'], raw.first_samp)
+
+    def __len__(self):
+        return len(self.onset)
+
+    def __repr__(self):
+        counts = ', '.join('{} ({})'.format(desc, len(pos))
+                           for desc, pos in zip(self.descriptions, self.positions))
+        return '<AnnotationIndex | {} annotations: {}>'.format(len(self), counts)
+
+    # ------------------------------------------------------------------
+    # Step 1: Condition and Time-Range Queries
+    # ------------------------------------------------------------------
+    def codes(self, conditions):
+        """Codes of the given description(s); unknown descriptions are skipped."""
+        if isinstance(conditions, str):
+            conditions = [conditions]
+        return [self._codes[c] for c in conditions if c in self._codes]
+
+    def select(self, condition=None, tmin=None, tmax=None):
+        """
+        Positions (into the sorted arrays) of annotations of ``condition``
+        (a description or list of them; None for all) with onset in
+        [tmin, tmax) seconds.
+        """
+        lo = -np.inf if tmin is None else tmin
+        hi = np.inf if tmax is None else tmax
+        if condition is None:
+            start, stop = np.searchsorted(self.onset, [lo, hi])
+            return np.arange(start, stop)
+        parts = []
+        for k in self.codes(condition):
+            start, stop = np.searchsorted(self._onsets[k], [lo, hi])
+            parts.append(self.positions[k][start:stop])
+        return np.sort(np.concatenate(parts)) if len(parts) > 1 else \
+            (parts[0] if parts else np.zeros(0, int))
+
+    def overlapping(self, tmin, tmax):
+        """Positions of annotations whose [onset, onset + duration] meets [tmin, tmax]."""
+        # Only onsets up to tmax can overlap; of those, only the ones starting
+        # after tmin - longest duration need checking.
+        stop = np.searchsorted(self.onset, tmax, side='right')
+        start = np.searchsorted(self.onset, tmin - (self.duration.max() if len(self) else 0.))
+        cand = np.arange(start, stop)
+        return cand[self.onset[cand] + self.duration[cand] >= tmin]
+
+    def bad_segments(self):
+        """Merged (n, 2) array of [start, stop] seconds of annotations starting with 'bad'."""
+        if self._bad is None:
+            bad = [k for k, desc in enumerate(self.descriptions) if desc.lower().startswith('bad')]
+            pos = np.sort(np.concatenate([self.positions[k] for k in bad])) if bad else \
+                np.zeros(0, int)
+            starts, stops = self.onset[pos], self.onset[pos] + self.duration[pos]
+            merged = []
+            for start, stop in zip(starts, stops):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], stop)
+                else:
+                    merged.append([start, stop])
+            self._bad = np.array(merged, float).reshape(-1, 2)
+        return self._bad
+
+    def overlaps_bad(self, condition=None, tmin=0., tmax=0., positions=None):
+        """
+        Boolean mask over ``positions`` (default: select(condition)) that is
+        True where the window [onset + tmin, onset + tmax] touches a bad
+        segment, e.g. tmin/tmax of the epochs to be cut.
+        """
+        if positions is None:
+            positions = self.select(condition)
+        bad = self.bad_segments()
+        t = self.onset[positions]
+        if not len(bad):
+            return np.zeros(len(t), bool)
+        # First bad segment ending at/after the window start; it overlaps if
+        # it also starts before the window end.
+        i = np.searchsorted(bad[:, 1], t + tmin, side='left')
+        inside = i < len(bad)
+        inside[inside] = bad[i[inside], 0] <= t[inside] + tmax
+        return inside
+
+    # ------------------------------------------------------------------
+    # Step 2: Events for mne.Epochs
+    # ------------------------------------------------------------------
+    def to_events(self, event_id=None, regexp=DEFAULT_REGEXP, positions=None):
+        """
+        Return ``events, event_id`` like mne.events_from_annotations(raw,
+        event_id, regexp): with event_id=None, codes 1, 2, ... follow the
+        sorted descriptions matching ``regexp``. ``positions`` restricts the
+        events (e.g. the output of select()).
+        """
+        pattern = re.compile('.*' if regexp is None else regexp)
+        values = np.zeros(len(self.descriptions), np.int64)
+        keep = np.zeros(len(self.descriptions), bool)
+        event_id_ = dict()
+        for k, desc in enumerate(self.descriptions):  # already sorted
+            if pattern.match(desc) is None:
+                continue
+            if isinstance(event_id, dict):
+                if desc not in event_id:
+                    continue
+                event_id_[desc] = event_id[desc]
+            elif event_id is None:
+                event_id_[desc] = len(event_id_) + 1
+            else:
+                trigger = event_id(desc)
+                if trigger is None:
+                    continue
+                event_id_[desc] = trigger
+            values[k], keep[k] = event_id_[desc], True
+        if not keep.any() and regexp is not None and len(self):
+            raise ValueError("Could not find any of the events you specified.")
+        idx = np.arange(len(self)) if positions is None else np.sort(positions)
+        idx = idx[keep[self.code[idx]]]
+        events = np.c_[self.sample[idx], np.zeros(len(idx), np.int64),
+                       values[self.code[idx]]].astype(int)
+        return events, event_id_
+
+    # ------------------------------------------------------------------
+    # Step 3: Persistence
+    # ------------------------------------------------------------------
+    def save(self, fname, source_stamp=None):
+        arrays = dict(onset=self.onset, duration=self.duration, sample=self.sample,
+                      code=self.code, descriptions=np.array(self.descriptions, str),
+                      sfreq=self.sfreq, first_samp=self.first_samp, version=CACHE_VERSION)
+        if source_stamp is not None:
+            arrays['source_stamp'] = source_stamp
+        np.savez(fname, **arrays)
+
+
+def read_annotation_index(fname):
+    """Read an index saved with AnnotationIndex.save()."""
+    with np.load(fname) as npz:
+        index = AnnotationIndex(npz['onset'], npz['duration'], npz['sample'], npz['code'],
+                                npz['descriptions'].tolist(), float(npz['sfreq']),
+                                int(npz['first_samp']))
+        index.source_stamp = npz['source_stamp'] if 'source_stamp' in npz else None
+        index.version = int(npz['version']) if 'version' in npz else 1
+    return index
+
+
+def index_fname(data_fname, sfreq):
+    """
+    Return the index cache file used for ``data_fname`` at ``sfreq`` (event
+    samples depend on the rate, so each rate keeps its own cache).
+    """
+    return '{}-annot-{:g}Hz.npz'.format(os.path.splitext(data_fname)[0], sfreq)
+
+
+def _source_stamp(data_fname):
+    stat = os.stat(data_fname)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _matches(index, raw):
+    # Same annotations as ``raw`` (in the same order): a cache hit for an
+    # unedited Raw costs a few vectorized comparisons, not a rebuild.
+    annot = raw.annotations
+    return (len(index) == len(annot)
+            and np.array_equal(index.onset, annot.onset - raw.first_samp / raw.info['sfreq'])
+            and np.array_equal(index.duration, annot.duration)
+            and np.array_equal(np.array(index.descriptions, str)[index.code],
+                               annot.description))
+
+
+def load_or_build_index(raw, data_fname=None):
+    """
+    Return the index of ``raw.annotations``, reading it from beside the data
+    file when a cache exists for the same file and sampling rate (resampled
+    data get their own cache), otherwise building and saving it. When
+    ``raw.annotations`` were edited in memory the index is built without
+    touching the cache, which describes the annotations of the file.
+    """
+    if data_fname is None:
+        data_fname = str(raw.filenames[0])
+    fname = index_fname(data_fname, raw.info['sfreq'])
+    stamp = _source_stamp(data_fname)
+    if os.path.exists(fname):
+        index = read_annotation_index(fname)
+        if (index.version == CACHE_VERSION and index.source_stamp is not None
+                and np.array_equal(index.source_stamp, stamp)
+                and index.first_samp == raw.first_samp
+                and index.sfreq == raw.info['sfreq']):
+            return index if _matches(index, raw) else AnnotationIndex.from_raw(raw)
+    index = AnnotationIndex.from_raw(raw)
+    index.save(fname, source_stamp=stamp)
+    return index
@@ -0,0 +1,282 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+# ------------------------------------------------------------------
+# End-to-end benchmark suite for the processing stages
+# ------------------------------------------------------------------
+# Times every stage of the scripts in this folder (load, filter, PSD,
+# re-reference, bad-channel interpolation, ICA, epoching, ERP, inverse) on
+# synthetic recordings (mne_synthetic_data.py), sweeping channel count,
+# duration, sampling rate and number of events. For each stage the wall time
+# and peak RSS are recorded.
+# Every run is appended to a JSON-lines history file and can be checked
+# against a stored baseline, e.g.:
+#
+#   python mne_benchmarks.py --n-channels 32 64 --duration 60 600 --check
+#   python mne_benchmarks.py --save-baseline
+#
+# Each configuration runs in a fresh process so memory numbers of one
+# configuration do not leak into the next.
+
+STAGES = ['load', 'filter', 'psd', 'reref', 'interpolate', 'ica', 'epoch', 'erp', 'inverse']
+# Stages nothing else depends on; they are skipped unless requested.
+LEAF_STAGES = {'psd', 'ica'}
+
+DEFAULT_HISTORY = 'benchmark_history.jsonl'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+
+# ------------------------------------------------------------------
+# Step 1: Stage Implementations (same calls as the scripts)
+# ------------------------------------------------------------------
+def _stage_load(state):
+    import mne
+    state['raw'] = mne.io.read_raw_fif(state['fname'], preload=True, verbose=False)
+
+
+def _stage_filter(state):
+    state['raw'] = state['raw'].filter(l_freq=1, h_freq=40, fir_design='firwin',
+                                       verbose=False)
+
+
+def _stage_psd(state):
+    from mne.time_frequency import psd_array_welch
+    raw = state['raw']
+    psd_array_welch(raw.get_data(), sfreq=raw.info['sfreq'], fmin=0, fmax=60,
+                    n_fft=2048, verbose=False)
+
+
+def _stage_reref(state):
+    # Average reference as a projector (applied right away): same data as
+    # set_eeg_reference('average'), but accepted by the inverse stage.
+    state['raw'].set_eeg_reference(ref_channels='average', projection=True, verbose=False)
+    state['raw'].apply_proj(verbose=False)
+
+
+def _stage_interpolate(state):
+    raw = state['raw']
+    raw.info['bads'] = list(state['bads'])
+    raw.interpolate_bads(reset_bads=True, verbose=False)
+
+
+def _stage_ica(state):
+    from mne.preprocessing import ICA
+    ica = ICA(n_components=min(20, len(state['raw'].ch_names) - 1), random_state=97,
+              max_iter='auto')
+    ica.fit(state['raw'], verbose=False)
+    ica.exclude = [0]
+    ica.apply(state['raw'], verbose=False)
+
+
+def _stage_epoch(state):
+    import mne
+    events, event_id = mne.events_from_annotations(state['raw'], verbose=False)
+    state['epochs'] = mne.Epochs(state['raw'], events, event_id=event_id, tmin=-0.2,
+                                 tmax=0.8, baseline=(None, 0), preload=True,
+                                 verbose=False)
+
+
+def _stage_erp(state):
+    state['evoked'] = state['epochs']['Encoding'].average()
+
+
+def _stage_inverse(state):
+    import mne
+    from mne.minimum_norm import apply_inverse, make_inverse_operator
+    noise_cov = mne.compute_covariance(state['epochs'], tmax=0., method='empirical',
+                                       verbose=False)
+    inv = make_inverse_operator(state['evoked'].info, state['fwd'], noise_cov,
+                                loose=0.2, depth=0.8, verbose=False)
+    apply_inverse(state['evoked'], inv, lambda2=1. / 9., method='dSPM', verbose=False)
+
+
+_STAGE_FUNCS = dict(load=_stage_load, filter=_stage_filter, psd=_stage_psd,
+                    reref=_stage_reref, interpolate=_stage_interpolate, ica=_stage_ica,
+                    epoch=_stage_epoch, erp=_stage_erp, inverse=_stage_inverse)
+
+
+def _setup_forward(info):
+    # Sphere head model + coarse volume source space: untimed setup for the
+    # inverse stage, since the scripts read a precomputed forward solution.
+    import mne
+    sphere = mne.make_sphere_model('auto', 'auto', info, verbose=False)
+    src = mne.setup_volume_source_space(sphere=sphere, pos=15., verbose=False)
+    return mne.make_forward_solution(info, trans=None, src=src, bem=sphere, eeg=True,
+                                     meg=False, verbose=False)
+
+
+def stages_to_run(selected):
+    """Selected stages plus the stages they depend on, in pipeline order."""
+    last = max(STAGES.index(s) for s in selected)
+    return [s for s in STAGES[:last + 1] if s in selected or s not in LEAF_STAGES]
+
+
+# ------------------------------------------------------------------
+# Step 2: Timing and Peak Memory per Stage
+# ------------------------------------------------------------------
+def run_config(config, stages, repeat=1):
+    """
+    Run the stages for one configuration (dict with n_channels, duration,
+    sfreq, n_events) ``repeat`` times. Returns one result per timed stage with
+    the best wall time and the largest peak RSS.
+    """
+    import gc
+
+    import mne
+    from mne_instrumentation import PeakRSS
+    from mne_synthetic_data import write_synthetic_fif
+
+    tmpdir = tempfile.mkdtemp()
+    fname = os.path.join(tmpdir, 'bench_raw.fif')
+    recording = write_synthetic_fif(fname, **config)
+    fwd = _setup_forward(mne.io.read_info(fname, verbose=False)) if 'inverse' in stages else None
+
+    results = {stage: dict(stage=stage, wall_s=np.inf, peak_rss_mb=0., delta_rss_mb=0.)
+               for stage in stages}
+    try:
+        for _ in range(repeat):
+            state = dict(fname=fname, fwd=fwd, bads=recording['bad_channels'])
+            for stage in stages_to_run(stages):
+                gc.collect()
+                with PeakRSS() as rss:
+                    t0 = time.perf_counter()
+                    _STAGE_FUNCS[stage](state)
+                    wall = time.perf_counter() - t0
+                if stage in results:
+                    res = results[stage]
+                    res['wall_s'] = min(res['wall_s'], wall)
+                    res['peak_rss_mb'] = max(res['peak_rss_mb'], rss.peak / 1e6)
+                    res['delta_rss_mb'] = max(res['delta_rss_mb'], (rss.peak - rss.start) / 1e6)
+    finally:
+        os.remove(fname)
+        os.rmdir(tmpdir)
+    return [dict(results[stage], **config) for stage in stages]
+
+
+def _run_isolated(config, stages, repeat):
+    # One fresh process per configuration for clean memory numbers.
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(run_config, config, stages, repeat).result()
+
+
+# ------------------------------------------------------------------
+# Step 3: History File and Baseline Regression Check
+# ------------------------------------------------------------------
+def result_key(result):
+    """Key identifying a stage + data shape, used to match baseline entries."""
+    return '{stage}|ch={n_channels}|dur={duration}|sfreq={sfreq}|ev={n_events}'.format(**result)
+
+
+def _environment():
+    import mne
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(commit=commit, host=platform.node(), python=platform.python_version(),
+                numpy=np.__version__, mne=mne.__version__, cpu_count=os.cpu_count())
+
+
+def append_history(fname, results):
+    """Append one run (all results) as a JSON line."""
+    record = dict(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), environment=_environment(),
+                  results=results)
+    with open(fname, 'a') as fid:
+        fid.write(json.dumps(record) + '\n')
+
+
+def save_baseline(fname, results):
+    """Write/update the baseline with these results."""
+    baseline = dict()
+    if os.path.exists(fname):
+        with open(fname) as fid:
+            baseline = json.load(fid)
+    for res in results:
+        baseline[result_key(res)] = dict(wall_s=res['wall_s'], peak_rss_mb=res['peak_rss_mb'])
+    with open(fname, 'w') as fid:
+        json.dump(baseline, fid, indent=2, sort_keys=True)
+
+
+def check_regressions(fname, results, time_tol=0.2, rss_tol=0.2):
+    """
+    Compare results with the baseline. Returns a list of messages, one per
+    stage whose wall time or peak RSS grew by more than the tolerance.
+    """
+    with open(fname) as fid:
+        baseline = json.load(fid)
+    regressions = []
+    for res in results:
+        ref = baseline.get(result_key(res))
+        if ref is None:
+            continue
+        for field, tol in (('wall_s', time_tol), ('peak_rss_mb', rss_tol)):
+            if res[field] > ref[field] * (1 + tol):
+                regressions.append('{}: {} {:.3f} -> {:.3f} (+{:.0%})'.format(
+                    result_key(res), field, ref[field], res[field],
+                    res[field] / ref[field] - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the EEG pipeline stages.')
+    parser.add_argument('--n-channels', type=int, nargs='+', default=[64])
+    parser.add_argument('--duration', type=float, nargs='+', default=[300.],
+                        help='recording duration in seconds')
+    parser.add_argument('--sfreq', type=float, nargs='+', default=[500.])
+    parser.add_argument('--n-events', type=int, nargs='+', default=[100])
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if a stage regressed against the baseline')
+    parser.add_argument('--time-tol', type=float, default=0.2)
+    parser.add_argument('--rss-tol', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    stages = [s for s in STAGES if s in args.stages]
+    results = []
+    for n_channels, duration, sfreq, n_events in itertools.product(
+            args.n_channels, args.duration, args.sfreq, args.n_events):
+        config = dict(n_channels=n_channels, duration=duration, sfreq=sfreq,
+                      n_events=n_events)
+        print("Config:", config)
+        for res in _run_isolated(config, stages, args.repeat):
+            print("  {stage:12s} {wall_s:9.3f} s  peak {peak_rss_mb:8.1f} MB"
+                  "  (+{delta_rss_mb:.1f} MB)".format(**res))
+            results.append(res)
+
+    append_history(args.history, results)
+    print("Results appended to", args.history)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print("Baseline saved to", args.baseline)
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print("No baseline found at", args.baseline)
+            return 1
+        regressions = check_regressions(args.baseline, results, args.time_tol, args.rss_tol)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            return 1
+        print("No regressions against", args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
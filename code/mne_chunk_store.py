@@ -0,0 +1,269 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# ------------------------------------------------------------------
+# Chunked, compressed store for random time-window / channel access
+# ------------------------------------------------------------------
+# A recording is converted once into a directory:
+#
+#   s17_1.eegz/
+#     info.fif      measurement info (mne.io.write_info)
+#     meta.json     shape, chunk layout, dtype, annotations
+#     index.npy     (n_groups, n_blocks, 2) byte offset / length of each chunk
+#     chunks.bin    the compressed chunks, back to back
+#
+# Data are cut into chunks of (channel group x time block), e.g. 8 channels x
+# 10 s. Every chunk is byte-shuffled and zlib-compressed independently, so
+# reading "channels X, Y from minute 37 to 38" only touches the chunks of the
+# groups holding X and Y that overlap that minute. chunks.bin is memory
+# mapped and the chunks of one request are decompressed in a thread pool
+# (zlib releases the GIL).
+#
+#   python mne_chunk_store.py s17_1.set s17_1.eegz
+#   store = ChunkStore('s17_1.eegz')
+#   data = store.get_data(picks=['Fz', 'Cz'], tmin=37 * 60, tmax=38 * 60)
+#
+# Samples are stored as float32 by default (ample for EEG); use
+# dtype='float64' for a lossless copy.
+
+FORMAT_VERSION = 1
+
+
+def _shuffle(data):
+    # Byte-plane shuffle: groups the slowly varying high-order bytes of
+    # neighbouring samples, which zlib compresses far better.
+    return np.ascontiguousarray(data.view(np.uint8).reshape(-1, data.itemsize).T)
+
+
+def _unshuffle(buf, dtype, shape):
+    itemsize = np.dtype(dtype).itemsize
+    planes = np.frombuffer(buf, np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+
+
+# ------------------------------------------------------------------
+# Step 1: Conversion
+# ------------------------------------------------------------------
+def write_store(raw, fname, group_size=8, block_duration=10., dtype='float32', level=1,
+                n_jobs=None, overwrite=False):
+    """
+    Convert ``raw`` (preloaded or not) into a chunk store directory
+    ``fname``. The recording is read one time block at a time; the chunks of
+    a block are compressed in parallel threads.
+    """
+    import mne
+
+    if os.path.exists(os.path.join(fname, 'meta.json')) and not overwrite:
+        raise FileExistsError("{} exists (use overwrite=True)".format(fname))
+    os.makedirs(fname, exist_ok=True)
+    sfreq = raw.info['sfreq']
+    n_channels, n_times = len(raw.ch_names), raw.n_times
+    block_size = max(1, int(round(block_duration * sfreq)))
+    groups = [(g, min(g + group_size, n_channels)) for g in range(0, n_channels, group_size)]
+    n_blocks = -(-n_times // block_size)
+    index = np.zeros((len(groups), n_blocks, 2), np.int64)
+
+    def compress(data):
+        return zlib.compress(_shuffle(np.ascontiguousarray(data, dtype)), level)
+
+    offset = 0
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as pool, \
+            open(os.path.join(fname, 'chunks.bin'), 'wb') as fid:
+        for b in range(n_blocks):
+            start, stop = b * block_size, min((b + 1) * block_size, n_times)
+            block = raw.get_data(start=start, stop=stop)
+            for g, chunk in enumerate(pool.map(compress, [block[g0:g1] for g0, g1 in groups])):
+                fid.write(chunk)
+                index[g, b] = offset, len(chunk)
+                offset += len(chunk)
+    np.save(os.path.join(fname, 'index.npy'), index)
+    mne.io.write_info(os.path.join(fname, 'info.fif'), raw.info)
+
+    annot = raw.annotations
+    meta = dict(
+        version=FORMAT_VERSION, sfreq=float(sfreq), n_channels=n_channels, n_times=int(n_times),
+        first_samp=int(raw.first_samp), ch_names=raw.ch_names, dtype=np.dtype(dtype).name,
+        codec='zlib+shuffle', group_size=group_size, block_size=block_size,
+        annotations=dict(onset=annot.onset.tolist(), duration=annot.duration.tolist(),
+                         description=annot.description.tolist(),
+                         orig_time=None if annot.orig_time is None
+                         else annot.orig_time.isoformat()))
+    with open(os.path.join(fname, 'meta.json'), 'w') as fid:
+        json.dump(meta, fid, indent=1)
+    return ChunkStore(fname)
+
+
+def convert(src, dst=None, **kwargs):
+    """Convert a recording file (.set, .fif, .edf, ...) into a chunk store."""
+    import mne
+
+    dst = dst or os.path.splitext(src)[0] + '.eegz'
+    raw = mne.io.read_raw(src, preload=False, verbose=False)
+    return write_store(raw, dst, **kwargs)
+
+
+# ------------------------------------------------------------------
+# Step 2: Reading Time Windows and Channel Subsets
+# ------------------------------------------------------------------
+class ChunkStore:
+    """
+    Read access to a chunk store. get_data() decompresses only the chunks
+    overlapping the requested channels and samples.
+    """
+
+    def __init__(self, fname, n_jobs=None):
+        self.fname = fname
+        with open(os.path.join(fname, 'meta.json')) as fid:
+            self.meta = json.load(fid)
+        if self.meta['version'] > FORMAT_VERSION:
+            raise ValueError("{} has format version {}; this reader supports {}".format(
+                fname, self.meta['version'], FORMAT_VERSION))
+        self.index = np.load(os.path.join(fname, 'index.npy'))
+        self.sfreq = self.meta['sfreq']
+        self.n_times = self.meta['n_times']
+        self.ch_names = self.meta['ch_names']
+        self.dtype = np.dtype(self.meta['dtype'])
+        self._fid = open(os.path.join(fname, 'chunks.bin'), 'rb')
+        self._map = mmap.mmap(self._fid.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(os.path.join(fname, 'chunks.bin')) else b''
+        self._pool = ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1)
+        self._info = None
+
+    def close(self):
+        self._pool.shutdown()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._fid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return '<ChunkStore | {} x {} ({:.1f} s), {} chunks of {} ch x {} samples>'.format(
+            len(self.ch_names), self.n_times, self.n_times / self.sfreq, self.index[..., 0].size,
+            self.meta['group_size'], self.meta['block_size'])
+
+    @property
+    def info(self):
+        if self._info is None:
+            import mne
+            self._info = mne.io.read_info(os.path.join(self.fname, 'info.fif'), verbose=False)
+        return self._info
+
+    @property
+    def annotations(self):
+        import mne
+
+        annot = self.meta['annotations']
+        # orig_time is stored as ISO 8601; mne.Annotations ignores strings.
+        orig_time = None if annot['orig_time'] is None \
+            else datetime.fromisoformat(annot['orig_time'])
+        return mne.Annotations(annot['onset'], annot['duration'], annot['description'],
+                               orig_time=orig_time)
+
+    def _picks(self, picks):
+        if picks is None:
+            return np.arange(len(self.ch_names))
+        picks = np.atleast_1d(picks)
+        if picks.dtype.kind in 'US':
+            missing = [ch for ch in picks if ch not in self.ch_names]
+            if missing:
+                raise ValueError("Channels not in store: {}".format(missing))
+            picks = np.array([self.ch_names.index(ch) for ch in picks])
+        return picks.astype(int)
+
+    def _read_chunk(self, g, b):
+        offset, length = self.index[g, b]
+        group_size, block_size = self.meta['group_size'], self.meta['block_size']
+        shape = (min(group_size, len(self.ch_names) - g * group_size),
+                 min(block_size, self.n_times - b * block_size))
+        return _unshuffle(zlib.decompress(self._map[offset:offset + length]), self.dtype, shape)
+
+    def get_data(self, picks=None, start=0, stop=None, tmin=None, tmax=None):
+        """
+        Data (n_picks, n_samples) for channel indices or names ``picks``
+        and samples [start, stop), or seconds [tmin, tmax) if given.
+        """
+        if tmin is not None:
+            start = int(round(tmin * self.sfreq))
+        if tmax is not None:
+            stop = int(round(tmax * self.sfreq))
+        stop = self.n_times if stop is None else min(stop, self.n_times)
+        start = max(0, start)
+        picks = self._picks(picks)
+        out = np.empty((len(picks), max(0, stop - start)), self.dtype)
+        if out.size == 0:
+            return out
+        group_size, block_size = self.meta['group_size'], self.meta['block_size']
+        groups = picks // group_size
+        blocks = range(start // block_size, (stop - 1) // block_size + 1)
+        jobs = [(g, b) for g in np.unique(groups) for b in blocks]
+
+        def fill(job):
+            g, b = job
+            chunk = self._read_chunk(g, b)
+            rows = np.flatnonzero(groups == g)
+            c0 = b * block_size
+            lo, hi = max(start, c0), min(stop, c0 + chunk.shape[1])
+            out[rows, lo - start:hi - start] = chunk[picks[rows] - g * group_size,
+                                                     lo - c0:hi - c0]
+        list(self._pool.map(fill, jobs))
+        return out
+
+    def to_raw(self, picks=None, tmin=None, tmax=None):
+        """RawArray of the selected channels/window, with cropped annotations."""
+        import mne
+
+        picks = self._picks(picks)
+        start = 0 if tmin is None else int(round(tmin * self.sfreq))
+        data = self.get_data(picks, start=start, tmax=tmax)
+        info = mne.pick_info(self.info, picks)
+        raw = mne.io.RawArray(data.astype(np.float64), info,
+                              first_samp=self.meta['first_samp'] + start, verbose=False)
+        annotations = self.annotations
+        if annotations.orig_time is None:
+            # Stored onsets count from sample 0 (as raw.annotations reports
+            # them); without a meas_date set_annotations() counts from the
+            # first sample of the window.
+            annotations.onset -= raw.first_time
+        # Annotations outside the window are dropped, overlapping ones cut.
+        raw.set_annotations(annotations, on_missing='ignore', emit_warning=False,
+                            verbose=False)
+        return raw
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert recordings into chunk stores.')
+    parser.add_argument('inputs', nargs='+', help='recording files (.set, .fif, .edf, ...)')
+    parser.add_argument('-o', '--output', help='store directory (single input only)')
+    parser.add_argument('--group-size', type=int, default=8, help='channels per chunk')
+    parser.add_argument('--block-duration', type=float, default=10., help='seconds per chunk')
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float64'])
+    parser.add_argument('--level', type=int, default=1, help='zlib compression level')
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args(argv)
+    if args.output and len(args.inputs) > 1:
+        parser.error('--output only works with a single input')
+    for src in args.inputs:
+        store = convert(src, args.output, group_size=args.group_size,
+                        block_duration=args.block_duration, dtype=args.dtype,
+                        level=args.level, overwrite=args.overwrite)
+        size = os.path.getsize(os.path.join(store.fname, 'chunks.bin'))
+        print("{} -> {}: {!r}, {:.1f} MB".format(src, store.fname, store, size / 1e6))
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+import argparse
+import os
+import sys
+
+from mne_instrumentation import configure, configure_from_env, disable, span, summary
+
+# ------------------------------------------------------------------
+# Headless command-line entry points for the workshop workflows
+# ------------------------------------------------------------------
+# The scripts in this folder import mne/matplotlib at the top, open plot
+# windows and wait on input(). For batch jobs the same workflows are
+# available as non-interactive subcommands:
+#
+#   python mne_cli.py filter  s17_1.set -o s17_1_filt-raw.fif --l-freq 1 --h-freq 40
+#   python mne_cli.py psd     s17_1.set -o s17_1_psd.npz --fmax 60 --plot psd.png
+#   python mne_cli.py epoch   s17_1.set -o s17_1-epo.fif --l-freq 1 --h-freq 40
+#   python mne_cli.py erp     s17_1-epo.fif -o s17_1-ave.fif --condition Encoding
+#   python mne_cli.py ica     s17_1.set -o s17_1_clean-raw.fif --l-freq 1 --exclude 0 3
+#   python mne_cli.py inverse s17_1-epo.fif --fwd s17_1-fwd.fif -o s17_1_dspm
+#
+# Only the standard library is imported at startup; mne, numpy and the
+# plotting backend are imported inside the commands that need them, and
+# matplotlib always uses the non-interactive Agg backend (figures are only
+# written when --plot is given). --trace writes a per-stage timing trace
+# (see mne_instrumentation.py).
+
+COMMANDS = ['filter', 'psd', 'epoch', 'erp', 'ica', 'inverse']
+
+
+# ------------------------------------------------------------------
+# Step 1: Shared Loading and Preprocessing
+# ------------------------------------------------------------------
+def _output(args, suffix):
+    """--output, or the input name with its extension replaced by ``suffix``."""
+    if args.output:
+        return args.output
+    stem = os.path.splitext(args.input)[0]
+    for tail in ('-raw', '-epo', '-ave', '_raw', '_epo'):
+        if stem.endswith(tail):
+            stem = stem[:-len(tail)]
+    return stem + suffix
+
+
+def _read_raw(fname, preload=True):
+    import mne
+    from mne_precision import load_data
+
+    ext = os.path.splitext(fname)[1].lower()
+    readers = {'.set': mne.io.read_raw_eeglab, '.fif': mne.io.read_raw_fif,
+               '.edf': mne.io.read_raw_edf, '.bdf': mne.io.read_raw_bdf,
+               '.vhdr': mne.io.read_raw_brainvision}
+    if ext not in readers:
+        raise SystemExit("Unsupported input format {!r} ({})".format(ext, fname))
+    raw = readers[ext](fname, preload=False)
+    if preload:
+        with span('load', fname=fname):
+            load_data(raw)
+    return raw
+
+
+def _target_sfreq(args, sfreq):
+    """--sfreq, or the rate the command's declared bandwidth allows after the low-pass."""
+    from mne_resample import plan_sfreq
+
+    if args.sfreq:
+        return args.sfreq if args.sfreq != sfreq else None
+    if args.no_resample or args.h_freq is None or args.bandwidth is None:
+        return None
+    target = plan_sfreq(sfreq, [args.bandwidth(args)], h_freq=args.h_freq)
+    n_fft = getattr(args, 'n_fft', None)
+    if target is not None and n_fft and (n_fft * target / sfreq) % 1:
+        return None  # --n-fft would not scale to the same frequency grid
+    return target
+
+
+def load_raw(args):
+    """Read the input recording and apply the shared preprocessing options."""
+    from mne_precision import filter_raw, load_data, notch_filter_raw
+    from mne_resample import resample_raw
+
+    raw = _read_raw(args.input, preload=False)
+    sfreq = _target_sfreq(args, raw.info['sfreq'])
+    if sfreq is None or args.notch:
+        with span('load', fname=args.input):
+            load_data(raw)
+    # Otherwise the resampler reads the file chunk by chunk.
+    if args.montage:
+        import mne
+
+        with span('montage', montage=args.montage):
+            raw.set_montage(mne.channels.make_standard_montage(args.montage),
+                            on_missing='warn')
+    if args.notch:
+        with span('notch', freqs=args.notch):
+            notch_filter_raw(raw, args.notch, fir_design='firwin')
+    if sfreq is not None:
+        with span('filter_resample', l_freq=args.l_freq, h_freq=args.h_freq, sfreq=sfreq):
+            # Band-pass and resampling fused in one chunked pass.
+            old_sfreq = raw.info['sfreq']
+            raw = resample_raw(raw, sfreq, args.l_freq, args.h_freq, fir_design='firwin')
+        print("Resampled to {:g} Hz".format(raw.info['sfreq']))
+        if getattr(args, 'n_fft', None):
+            # Same window duration, so the PSD keeps its frequency grid.
+            args.n_fft = int(round(args.n_fft * raw.info['sfreq'] / old_sfreq))
+    elif args.l_freq is not None or args.h_freq is not None:
+        with span('filter', l_freq=args.l_freq, h_freq=args.h_freq):
+            filter_raw(raw, args.l_freq, args.h_freq, fir_design='firwin')
+    if args.bads:
+        raw.info['bads'] = [ch for ch in args.bads if ch in raw.ch_names]
+    if args.reference:
+        with span('reref', reference=args.reference):
+            # Projector applied right away: same data as an average reference,
+            # but still accepted by the inverse command.
+            raw.set_eeg_reference(ref_channels='average', projection=True)
+            raw.apply_proj()
+    return raw
+
+
+def load_epochs(args):
+    """Read ``-epo.fif`` input directly, otherwise epoch the recording."""
+    import mne
+
+    if args.input.endswith(('-epo.fif', '_epo.fif')):
+        from mne_precision import cast
+
+        with span('load', fname=args.input):
+            epochs = cast(mne.read_epochs(args.input, preload=True))
+    else:
+        raw = load_raw(args)
+        with span('events'):
+            events, event_id = mne.events_from_annotations(raw)
+        with span('epoch', n_events=len(events)) as sp:
+            epochs = mne.Epochs(raw, events, event_id=event_id, tmin=args.tmin,
+                                tmax=args.tmax, baseline=(None, 0), preload=True)
+            sp.set(n_epochs=len(epochs))
+    if args.condition:
+        if args.condition not in epochs.event_id:
+            raise SystemExit("No {!r} event found. Available events: {}".format(
+                args.condition, sorted(epochs.event_id)))
+        epochs = epochs[args.condition]
+    return epochs
+
+
+def _save_figure(fig, fname):
+    import matplotlib.pyplot as plt
+
+    fig.savefig(fname, dpi=100)
+    plt.close(fig)
+    print("Figure saved to", fname)
+
+
+# ------------------------------------------------------------------
+# Step 2: Commands
+# ------------------------------------------------------------------
+def cmd_filter(args):
+    raw = load_raw(args)
+    fname = _output(args, '_filt-raw.fif')
+    with span('save', fname=fname):
+        raw.save(fname, overwrite=True)
+    print("Filtered data saved to", fname)
+
+
+def cmd_psd(args):
+    import numpy as np
+    from mne.time_frequency import psd_array_welch
+
+    raw = load_raw(args)
+    picks = raw.copy().pick('data', exclude='bads')
+    with span('psd', n_fft=args.n_fft, fmax=args.fmax):
+        psds, freqs = psd_array_welch(picks.get_data(), sfreq=raw.info['sfreq'],
+                                      fmin=args.fmin, fmax=args.fmax, n_fft=args.n_fft)
+    fname = _output(args, '_psd.npz')
+    if fname.endswith('.csv'):
+        # One row per frequency: freq, then one column per channel.
+        np.savetxt(fname, np.column_stack([freqs, psds.T]), delimiter=',',
+                   header=','.join(['freq'] + picks.ch_names), comments='')
+    else:
+        np.savez(fname, psds=psds, freqs=freqs, ch_names=picks.ch_names)
+    print("PSD ({} channels, {} frequencies) saved to".format(*psds.shape), fname)
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(8, 6))
+        ax.plot(freqs, psds.mean(axis=0))
+        ax.set(xlabel='Frequency (Hz)', ylabel='Power Spectral Density',
+               title='Average PSD: ' + os.path.basename(args.input))
+        _save_figure(fig, args.plot)
+
+
+def cmd_epoch(args):
+    from mne_precision import cast
+
+    epochs = load_epochs(args)
+    fname = _output(args, '-epo.fif')
+    with span('save', fname=fname):
+        # Epochs.save() only accepts float64 data (stored as float32 on disk).
+        cast(epochs, 'float64').save(fname, overwrite=True)
+    print("{} epochs saved to".format(len(epochs)), fname)
+
+
+def cmd_erp(args):
+    from mne_precision import average
+
+    epochs = load_epochs(args)
+    with span('erp', n_epochs=len(epochs)):
+        evoked = average(epochs)
+    fname = _output(args, '-ave.fif')
+    with span('save', fname=fname):
+        evoked.save(fname, overwrite=True)
+    print("Evoked response ({} epochs) saved to".format(evoked.nave), fname)
+    if args.plot:
+        fig = evoked.plot(time_unit='s', show=False)
+        fig.suptitle("Evoked Response (ERP){}".format(
+            ' for ' + args.condition if args.condition else ''))
+        _save_figure(fig, args.plot)
+
+
+def cmd_ica(args):
+    from mne.preprocessing import ICA
+    from mne_ica_scoring import find_artifact_components
+    from mne_precision import fit_ica
+
+    raw = load_raw(args)
+    ica = ICA(n_components=args.n_components, random_state=97, max_iter='auto')
+    with span('ica_fit', n_components=args.n_components):
+        fit_ica(ica, raw)
+    if args.exclude is not None:
+        ica.exclude = args.exclude
+    else:
+        with span('ica_artifact_scoring', n_components=ica.n_components_):
+            ica.exclude, _ = find_artifact_components(ica, raw, eog=args.eog, ecg=args.ecg)
+    print("Excluded ICA components:", ica.exclude)
+    with span('ica_apply', n_excluded=len(ica.exclude)):
+        ica.apply(raw)
+    fname = _output(args, '_clean-raw.fif')
+    with span('save', fname=fname):
+        raw.save(fname, overwrite=True)
+        ica.save(os.path.splitext(fname)[0].replace('-raw', '') + '-ica.fif', overwrite=True)
+    print("Cleaned data saved to", fname)
+    if args.plot:
+        figs = ica.plot_components(inst=raw, show=False)
+        for k, fig in enumerate(figs if isinstance(figs, list) else [figs]):
+            root, ext = os.path.splitext(args.plot)
+            _save_figure(fig, args.plot if k == 0 else '{}_{}{}'.format(root, k, ext))
+
+
+def cmd_inverse(args):
+    import mne
+    from mne.minimum_norm import make_inverse_operator
+    from mne_precision import apply_inverse, average, compute_covariance
+
+    epochs = load_epochs(args)
+    with span('forward', fname=args.fwd):
+        fwd = mne.read_forward_solution(args.fwd)
+    with span('covariance'):
+        noise_cov = compute_covariance(epochs, tmax=0., method=['shrunk', 'empirical'])
+    evoked = average(epochs)
+    with span('inverse', method=args.method):
+        inv = make_inverse_operator(evoked.info, fwd, noise_cov, loose=0.2, depth=0.8)
+        stc = apply_inverse(evoked, inv, lambda2=1. / args.snr ** 2, method=args.method)
+    fname = _output(args, '_' + args.method.lower())
+    with span('save', fname=fname):
+        stc.save(fname, overwrite=True)
+    print("{} source estimate saved to".format(args.method), fname)
+
+
+# ------------------------------------------------------------------
+# Step 3: Argument Parsing
+# ------------------------------------------------------------------
+def _add_preprocessing(parser):
+    group = parser.add_argument_group('preprocessing (applied after loading)')
+    group.add_argument('--l-freq', type=float, help='high-pass edge (Hz)')
+    group.add_argument('--h-freq', type=float, help='low-pass edge (Hz)')
+    group.add_argument('--notch', type=float, nargs='+', help='notch frequencies (Hz)')
+    group.add_argument('--montage', help="standard montage, e.g. 'standard_1020'")
+    group.add_argument('--bads', nargs='+', help='channels to mark as bad')
+    group.add_argument('--reference', choices=['average'], help='re-reference the EEG')
+    group.add_argument('--sfreq', type=float,
+                       help='resample to this rate (fused with the band-pass); by default '
+                            'the rate is lowered to what the command needs after --h-freq')
+    group.add_argument('--no-resample', action='store_true', help='keep the native rate')
+
+
+def _add_epoching(parser):
+    group = parser.add_argument_group('epoching')
+    group.add_argument('--tmin', type=float, default=-0.2)
+    group.add_argument('--tmax', type=float, default=0.8)
+    group.add_argument('--condition', help="keep only this condition, e.g. 'Encoding'")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Non-interactive EEG processing commands.')
+    parser.add_argument('--trace', help='write a stage trace (.json: Chrome trace, .jsonl)')
+    parser.add_argument('--verbose', default='WARNING', help='MNE log level')
+    parser.add_argument('--precision', choices=['float32', 'float64'],
+                        help='sample precision of data, epochs, ERPs and source estimates '
+                             '(default: $PIPELINE_PRECISION or float64)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    # ``bandwidth``: highest frequency (Hz) a command needs from the data,
+    # used to pick the resampling rate; None keeps the native rate.
+    def add(name, func, help, bandwidth=None):
+        p = sub.add_parser(name, help=help)
+        p.add_argument('input', help='recording (.set, .fif, .edf, ...)')
+        p.add_argument('-o', '--output', help='output file (default: derived from input)')
+        p.set_defaults(func=func, bandwidth=bandwidth)
+        _add_preprocessing(p)
+        return p
+
+    def low_pass(args):
+        return args.h_freq
+
+    add('filter', cmd_filter, 'filter and save a recording')
+    p = add('psd', cmd_psd, 'Welch PSD of every channel (.npz or .csv)',
+            bandwidth=lambda args: args.fmax)
+    p.add_argument('--fmin', type=float, default=0.)
+    p.add_argument('--fmax', type=float, default=60.)
+    p.add_argument('--n-fft', type=int, default=2048,
+                   help='FFT length in samples of the input (scaled when resampling)')
+    p.add_argument('--plot', help='save the average PSD figure to this file')
+    _add_epoching(add('epoch', cmd_epoch, 'epoch around annotations', bandwidth=low_pass))
+    p = add('erp', cmd_erp, 'average epochs into an evoked response', bandwidth=low_pass)
+    _add_epoching(p)
+    p.add_argument('--plot', help='save the ERP figure to this file')
+    p = add('ica', cmd_ica, 'fit ICA, remove artifact components, save', bandwidth=low_pass)
+    p.add_argument('--n-components', type=int, default=20)
+    p.add_argument('--exclude', type=int, nargs='*',
+                   help='components to remove (default: EOG/ECG-correlated components)')
+    p.add_argument('--eog', nargs='*',
+                   help='EOG channels used to find components (default: all EOG channels, '
+                        'else frontal proxies)')
+    p.add_argument('--ecg', nargs='*',
+                   help='ECG channels used to find components (default: all ECG channels)')
+    p.add_argument('--plot', help='save the component topographies to this file')
+    p = add('inverse', cmd_inverse, 'noise covariance + inverse solution of the ERP',
+            bandwidth=low_pass)
+    _add_epoching(p)
+    p.add_argument('--fwd', required=True, help='forward solution (-fwd.fif)')
+    p.add_argument('--method', default='dSPM', choices=['MNE', 'dSPM', 'sLORETA', 'eLORETA'])
+    p.add_argument('--snr', type=float, default=3.)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Headless: never open windows, even if a command plots.
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    os.environ.setdefault('MNE_BROWSER_BACKEND', 'matplotlib')
+    tracer = configure(args.trace) if args.trace else configure_from_env()
+    from mne_precision import precision_from_env, set_precision
+
+    if args.precision:
+        set_precision(args.precision)
+    else:
+        precision_from_env()
+    import mne
+
+    mne.set_log_level(args.verbose)
+    try:
+        with span(args.command, input=args.input):
+            args.func(args)
+    finally:
+        if tracer is not None:
+            disable()
+            print(summary(tracer.records))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
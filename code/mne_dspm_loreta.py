@@ -8,6 +8,7 @@ import numpy as np
 import mne
 from mne.datasets import sample
 from mne.minimum_norm import apply_inverse, make_inverse_operator
+from mne_epoch_rejection import epochs_with_rejection
 
 # %%
 # Process MEG data
@@ -25,7 +26,9 @@ raw.info["bads"] = ["MEG 2443", "EEG 053"]  # mark known bad channels
 baseline = (None, 0)  # means from the first instant to t = 0
 reject = dict(grad=4000e-13, mag=4e-12, eog=150e-6)
 
-epochs = mne.Epochs(
+# The peak-to-peak rejection runs on the continuous data first; rejected
+# epochs are never read (mne_epoch_rejection.py).
+epochs = epochs_with_rejection(
     raw,
     events,
     event_id,
@@ -149,10 +152,41 @@ brain.add_foci(
 brain.add_text(
     0.1, 0.9, "dSPM (plus location of maximal activation)", "title", font_size=14
 )
+
+# %%
+# Beyond the single global maximum: the strongest local maxima around the
+# peak time and the suprathreshold clusters, using a vertex adjacency index
+# of the source space (see mne_source_peaks.py).
+
+from mne_source_peaks import build_adjacency_index, find_clusters, find_peaks
+
+adjacency = build_adjacency_index(inverse_operator["src"])
+peaks = find_peaks(stc, adjacency, n_peaks=5, threshold=8, window=0.05, hemi="rh")
+near_peak = np.abs(peaks["time"] - time_max) <= 0.025
+brain.add_foci(
+    peaks["vertex"][near_peak],
+    coords_as_verts=True,
+    hemi="rh",
+    color="white",
+    scale_factor=0.4,
+    alpha=0.5,
+)
+clusters = find_clusters(stc, adjacency, threshold=8, hemi="rh", min_size=10)
+for cluster in clusters[:5]:
+    print(
+        f"cluster: {cluster['size']} vertex-samples, mass {cluster['mass']:.1f}, "
+        f"peak at {cluster['peak_time']:.3f} s"
+    )
 hello=input("")
 # The documentation website's movie is generated with:
 # brain.save_movie(..., tmin=0.05, tmax=0.15, interpolation='linear',
 #                  time_dilation=20, framerate=10, time_viewer=True)
+#
+# To render the same movie headlessly, with the frames split across worker
+# processes (see mne_offscreen_render.py):
+# from mne_offscreen_render import render_movie
+# render_movie(stc, "dspm_rh.mp4", tmin=0.05, tmax=0.15, time_dilation=20,
+#              framerate=10, **surfer_kwargs)
 
 # %%
 # There are many other ways to visualize and work with source data, see
@@ -0,0 +1,236 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from mne.io import BaseRaw
+
+# ------------------------------------------------------------------
+# Parallel multi-run EDF ingestion with on-demand decoding
+# ------------------------------------------------------------------
+# Several EDF runs (e.g. all EEGBCI runs of all subjects) exposed as one
+# continuous, lazily loaded recording:
+#
+#   raw = read_edf_runs(eegbci.load_data(subject=1, runs=[4, 8, 12]))
+#
+# Headers (and the EDF+ annotation channel) of all files are parsed in a
+# thread pool, and channel names, sampling rate and record layout are checked
+# before anything else happens. Nothing is decoded up front: when data are
+# requested (get_data(), crop, load_data(), ...) only the EDF data records
+# covering the requested samples are read and converted, split into
+# chunks that are decoded in parallel threads. Run boundaries are marked
+# with 'BAD boundary' / 'EDGE boundary' annotations, exactly as
+# mne.concatenate_raws() does, and each run's own annotations are shifted
+# to the combined time axis.
+#
+# Only 16-bit EDF/EDF+ with a common sampling rate across data channels is
+# handled (BDF, GDF and mixed-rate files: use mne.io.read_raw_edf).
+
+_POOL = None
+
+
+def _pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _POOL
+
+
+# ------------------------------------------------------------------
+# Step 1: EDF Header Parsing
+# ------------------------------------------------------------------
+# Scale from the EDF physical dimension to SI units (as MNE's reader).
+_UNIT_SCALE = {'uv': 1e-6, 'µv': 1e-6, 'μv': 1e-6, 'mv': 1e-3, 'nv': 1e-9, 'v': 1.}
+
+_SIGNAL_FIELDS = [('label', 16), ('transducer', 80), ('physical_dim', 8),
+                  ('physical_min', 8), ('physical_max', 8), ('digital_min', 8),
+                  ('digital_max', 8), ('prefilter', 80), ('n_samples', 8), ('reserved', 32)]
+
+
+def read_edf_header(fname):
+    """
+    Parse the fixed and per-signal EDF header. Returns a dict with the data
+    record layout and, for the data channels (all signals except 'EDF
+    Annotations'), their labels, sample offsets within a record and the
+    gain/offset converting digital values to SI units.
+    """
+    with open(fname, 'rb') as fid:
+        fixed = fid.read(256).decode('latin-1')
+        n_signals = int(fixed[252:256])
+        raw_fields = fid.read(256 * n_signals).decode('latin-1')
+    header_bytes = int(fixed[184:192])
+    record_duration = float(fixed[244:252])
+
+    fields, pos = dict(), 0
+    for name, width in _SIGNAL_FIELDS:
+        fields[name] = [raw_fields[pos + k * width:pos + (k + 1) * width].strip()
+                        for k in range(n_signals)]
+        pos += width * n_signals
+    n_samples = np.array(fields['n_samples'], int)
+    record_samples = int(n_samples.sum())
+    record_bytes = 2 * record_samples
+
+    data = np.array([label != 'EDF Annotations' for label in fields['label']])
+    spr = np.unique(n_samples[data])
+    if len(spr) != 1:
+        raise ValueError("{}: data channels have different sampling rates ({} samples per "
+                         "record); use mne.io.read_raw_edf".format(fname, sorted(spr)))
+    spr = int(spr[0])
+
+    # The header may announce -1 (unknown) records or more than were written.
+    available = (os.path.getsize(fname) - header_bytes) // record_bytes
+    n_records = int(fixed[236:244])
+    n_records = available if n_records < 0 else min(n_records, available)
+
+    def numbers(name):
+        return np.array(fields[name], float)[data]
+
+    unit = np.array([_UNIT_SCALE.get(dim.lower(), 1.) for dim in fields['physical_dim']])[data]
+    gain = (numbers('physical_max') - numbers('physical_min')) / \
+        (numbers('digital_max') - numbers('digital_min'))
+    offset = numbers('physical_min') - numbers('digital_min') * gain
+    return dict(
+        fname=fname, header_bytes=header_bytes, n_records=n_records,
+        record_duration=record_duration, record_samples=record_samples,
+        record_bytes=record_bytes, samples_per_record=spr,
+        sfreq=spr / record_duration, n_times=n_records * spr,
+        ch_names=[label for label, keep in zip(fields['label'], data) if keep],
+        units=[dim for dim, keep in zip(fields['physical_dim'], data) if keep],
+        sample_offsets=np.concatenate([[0], np.cumsum(n_samples)[:-1]])[data],
+        gain=gain * unit, offset=offset * unit)
+
+
+def _read_run(fname):
+    # Header for decoding + MNE's reader (not preloaded) for info and the
+    # EDF+ annotations.
+    import mne
+
+    header = read_edf_header(fname)
+    raw = mne.io.read_raw_edf(fname, preload=False, verbose=False)
+    return header, raw
+
+
+def read_run_headers(fnames, n_jobs=None):
+    """Parse every file with up to ``n_jobs`` threads; returns (header, raw) pairs."""
+    n_jobs = n_jobs or min(len(fnames), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(_read_run, [str(fname) for fname in fnames]))
+
+
+def check_runs(runs):
+    """
+    Raise a ValueError listing every run whose channels, sampling rate or
+    units differ from the first run.
+    """
+    (ref, ref_raw), problems = runs[0], []
+    for header, raw in runs[1:]:
+        name = os.path.basename(header['fname'])
+        if raw.ch_names != ref_raw.ch_names:
+            missing = sorted(set(ref_raw.ch_names) - set(raw.ch_names))
+            extra = sorted(set(raw.ch_names) - set(ref_raw.ch_names))
+            problems.append('{}: channels differ (missing {}, extra {}{})'.format(
+                name, missing, extra, ', order differs' if not missing and not extra else ''))
+        if header['sfreq'] != ref['sfreq']:
+            problems.append('{}: sfreq {} Hz, expected {} Hz'.format(
+                name, header['sfreq'], ref['sfreq']))
+        if header['units'] != ref['units']:
+            problems.append('{}: physical units differ'.format(name))
+        if len(header['ch_names']) != len(raw.ch_names):
+            problems.append('{}: unexpected channel layout'.format(name))
+    if problems:
+        raise ValueError("Incompatible EDF runs (reference: {}):\n  {}".format(
+            os.path.basename(ref['fname']), '\n  '.join(problems)))
+
+
+# ------------------------------------------------------------------
+# Step 2: Record Decoding
+# ------------------------------------------------------------------
+def _decode_records(fname, extras, r0, r1, out):
+    """Decode data records [r0, r1) of one file into ``out`` (n_channels, n)."""
+    with open(fname, 'rb') as fid:
+        fid.seek(extras['header_bytes'] + r0 * extras['record_bytes'])
+        buf = fid.read((r1 - r0) * extras['record_bytes'])
+    records = np.frombuffer(buf, '<i2').reshape(r1 - r0, extras['record_samples'])
+    spr = extras['samples_per_record']
+    cols = extras['sample_offsets'][:, None] + np.arange(spr)
+    # (records, channels, spr) -> (channels, records * spr)
+    digital = records[:, cols].transpose(1, 0, 2).reshape(len(cols), -1)
+    np.multiply(digital, extras['gain'][:, None], out=out)
+    out += extras['offset'][:, None]
+
+
+class RawEDFRuns(BaseRaw):
+    """
+    Several EDF runs as one lazily loaded Raw (one 'file' per run). See
+    read_edf_runs(). ``runs`` lists (fname, first sample, n_times) per run.
+    """
+
+    def __init__(self, runs, records_per_chunk=None, preload=False, verbose=None):
+        import mne
+
+        check_runs(runs)
+        headers = [header for header, _ in runs]
+        info = runs[0][1].info.copy()
+        sfreq = info['sfreq']
+        raw_extras = []
+        for header in headers:
+            extras = {k: header[k] for k in (
+                'header_bytes', 'record_bytes', 'record_samples', 'samples_per_record',
+                'sample_offsets', 'gain', 'offset')}
+            # ~8 MB of raw records per decoding task unless given.
+            extras['records_per_chunk'] = records_per_chunk or max(
+                1, int(8e6 // header['record_bytes']))
+            raw_extras.append(extras)
+        n_times = [header['n_times'] for header in headers]
+        super().__init__(
+            info, preload=False, filenames=[header['fname'] for header in headers],
+            first_samps=[0] * len(headers), last_samps=[n - 1 for n in n_times],
+            raw_extras=raw_extras, orig_format='short', verbose=verbose)
+
+        starts = np.concatenate([[0], np.cumsum(n_times)[:-1]])
+        self.runs = [dict(fname=header['fname'], start=int(start), n_times=int(n))
+                     for header, start, n in zip(headers, starts, n_times)]
+        onset, duration, description = [], [], []
+        for (_, raw), start in zip(runs, starts):
+            onset.extend(raw.annotations.onset + start / sfreq)
+            duration.extend(raw.annotations.duration)
+            description.extend(raw.annotations.description)
+        for start in starts[1:]:
+            onset.extend([start / sfreq] * 2)
+            duration.extend([0., 0.])
+            description.extend(['BAD boundary', 'EDGE boundary'])
+        order = np.argsort(onset, kind='stable')
+        self.set_annotations(mne.Annotations(
+            np.array(onset)[order], np.array(duration)[order],
+            np.array(description)[order], orig_time=info['meas_date']))
+        if preload:
+            self.load_data()
+
+    def _read_segment_file(self, data, idx, fi, start, stop, cals, mult):
+        from mne._fiff.utils import _mult_cal_one
+
+        extras = self._raw_extras[fi]
+        fname = self._filenames[fi]
+        spr = extras['samples_per_record']
+        r0, r1 = start // spr, -(-stop // spr)
+        block = np.empty((len(extras['gain']), (r1 - r0) * spr))
+        step = extras['records_per_chunk']
+        bounds = [(r, min(r + step, r1)) for r in range(r0, r1, step)]
+        list(_pool().map(
+            lambda b: _decode_records(fname, extras, b[0], b[1],
+                                      block[:, (b[0] - r0) * spr:(b[1] - r0) * spr]),
+            bounds))
+        _mult_cal_one(data, block[:, start - r0 * spr:stop - r0 * spr], idx, cals, mult)
+
+
+def read_edf_runs(fnames, n_jobs=None, preload=False, records_per_chunk=None,
+                  verbose=None):
+    """
+    Read EDF runs as one continuous Raw (RawEDFRuns). Headers are parsed with
+    ``n_jobs`` threads and validated before the object is built; data are
+    decoded on demand (``preload=True`` decodes everything right away).
+    """
+    if not len(fnames):
+        raise ValueError("No EDF files given.")
+    runs = read_run_headers(fnames, n_jobs=n_jobs)
+    return RawEDFRuns(runs, records_per_chunk=records_per_chunk, preload=preload,
+                      verbose=verbose)
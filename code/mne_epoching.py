@@ -1,5 +1,7 @@
 import os
 import mne
+from mne_annotation_index import load_or_build_index
+from mne_epoch_rejection import epochs_with_rejection
 
 # ------------------------------------------------------------------
 # Step 1: Load the EEG Data (EEGLAB .set file)
@@ -17,7 +19,11 @@ raw.plot(n_channels=64, title='Raw Data: Before Epoching', show=True)
 # Step 2: Convert Annotations to Events
 # ------------------------------------------------------------------
 # This converts the annotations (e.g., "Encoding", "Recall", etc.) into an event array.
-events, event_id = mne.events_from_annotations(raw)
+# The annotation index (cached beside the data file as s17_1-annot-<sfreq>Hz.npz)
+# builds the events from interned description codes instead of re-parsing the
+# strings.
+index = load_or_build_index(raw, set_file_path)
+events, event_id = index.to_events()
 print("Event IDs found:", event_id)
 print("Number of events detected:", len(events))
 
@@ -32,10 +38,12 @@ if "Encoding" not in event_id:
 tmin = -0.2  # Start time: 200 ms before the event
 tmax = 0.8   # End time: 800 ms after the event
 baseline = (None, 0)  # Use data from before the event for baseline correction
+reject = dict(eeg=150e-6)  # Drop epochs with EEG peak-to-peak above 150 µV
 
 # Create epochs for all conditions using the events array and event_id dictionary.
-epochs = mne.Epochs(raw, events, event_id=event_id, tmin=tmin, tmax=tmax,
-                    baseline=baseline, preload=True)
+# Epochs exceeding the threshold are found on the continuous data and never extracted.
+epochs = epochs_with_rejection(raw, events, event_id=event_id, tmin=tmin, tmax=tmax,
+                               reject=reject, baseline=baseline, preload=True)
 print("Epochs created.")
 # Extract epochs specifically for the "Encoding" condition.
 epochs_encoding = epochs["Encoding"]
@@ -1,13 +1,19 @@
 import os
 import mne
 import matplotlib.pyplot as plt
+from mne_annotation_index import load_or_build_index
+from mne_epoch_rejection import epochs_with_rejection
+from mne_precision import average, load_data, precision_from_env
+
+# PIPELINE_PRECISION=float32 keeps the data, epochs and ERP in single precision.
+precision_from_env()
 
 # ------------------------------------------------------------------
 # Step 1: Load EEG Data from an EEGLAB (.set) File
 # ------------------------------------------------------------------
 # Use a raw string to avoid escape issues in Windows file paths.
 set_file_path = 's17_1.set'
-raw = mne.io.read_raw_eeglab(set_file_path, preload=True)
+raw = load_data(mne.io.read_raw_eeglab(set_file_path, preload=False))
 print("Raw Data Loaded:")
 print(raw)
 
@@ -18,7 +24,11 @@ raw.plot(n_channels=64, title='Raw Data: Before Epoching', show=True)
 # Step 2: Convert Annotations to Events
 # ------------------------------------------------------------------
 # Convert the annotations (e.g., "Encoding", "Recall", etc.) into an event array.
-events, event_id = mne.events_from_annotations(raw)
+# The annotation index (cached beside the data file as s17_1-annot-<sfreq>Hz.npz)
+# builds the events from interned description codes instead of re-parsing the
+# strings.
+index = load_or_build_index(raw, set_file_path)
+events, event_id = index.to_events()
 print("Event IDs found:", event_id)
 print("Total events detected:", len(events))
 
@@ -33,10 +43,12 @@ if "Encoding" not in event_id:
 tmin = -0.2  # Start time: 200 ms before the event
 tmax = 0.8   # End time: 800 ms after the event
 baseline = (None, 0)  # Baseline correction: from the beginning of the epoch up to time 0
+reject = dict(eeg=150e-6)  # Drop epochs with EEG peak-to-peak above 150 µV
 
 # Create epochs using all detected events.
-epochs = mne.Epochs(raw, events, event_id=event_id, tmin=tmin, tmax=tmax,
-                    baseline=baseline, preload=True)
+# Epochs exceeding the threshold are found on the continuous data and never extracted.
+epochs = epochs_with_rejection(raw, events, event_id=event_id, tmin=tmin, tmax=tmax,
+                               reject=reject, baseline=baseline, preload=True)
 print("Epochs created.")
 
 # Extract epochs specifically for the "Encoding" condition.
@@ -50,7 +62,7 @@ epochs_encoding.plot(n_epochs=5, n_channels=64, title="Epochs: Encoding Conditio
 # Step 4: Compute the Evoked Response (ERP)
 # ------------------------------------------------------------------
 # Average the epochs to compute the ERP for the "Encoding" condition.
-evoked_encoding = epochs_encoding.average()
+evoked_encoding = average(epochs_encoding)
 print("Evoked response for 'Encoding' computed.")
 
 # Plot the ERP. Since the plot() function does not accept a title parameter directly,
@@ -0,0 +1,251 @@
+import numpy as np
+
+# ------------------------------------------------------------------
+# Batched ICA artifact scoring on the continuous data
+# ------------------------------------------------------------------
+# ica.find_bads_eog(create_eog_epochs(raw)) builds epochs, computes the
+# sources once per reference channel and scores them one channel at a time.
+# Here the component time courses are computed once, chunk by chunk, from
+# a single (components x channels) operator; every chunk is band-limited
+# (1-10 Hz for EOG, 8-16 Hz for ECG, the same FIR as MNE's scoring) and
+# running sums give the Pearson correlation of all components with all
+# reference channels at once:
+#
+#   exclude, scores = find_artifact_components(ica, raw)
+#   ica.exclude = exclude
+#
+# References are the EOG and ECG channels of the recording. Without an EOG
+# channel, frontal electrodes stand in for it: the mean of the Fp (else AF)
+# channels for blinks / vertical movements and F7 - F8 (else AF7 - AF8) for
+# horizontal movements. Components are selected per reference by iterative
+# z-scoring (as ica.find_bads_eog(measure='zscore')), no epochs are built
+# and memory stays bounded by the chunk size.
+
+BANDS = dict(eog=(1., 10.), ecg=(8., 16.))
+
+# Proxy channels used in order of preference; bad channels are skipped.
+VEOG_PROXIES = (('Fp1', 'Fpz', 'Fp2'), ('AF7', 'AF3', 'AFz', 'AF4', 'AF8'))
+HEOG_PROXIES = (('F7', 'F8'), ('AF7', 'AF8'), ('FT7', 'FT8'))
+
+
+# ------------------------------------------------------------------
+# Step 1: Unmixing Operator and Reference Channels
+# ------------------------------------------------------------------
+def unmixing_operator(ica):
+    """
+    Return ``W, offset`` such that the ICA sources of data ``X`` (channels
+    ``ica.ch_names``) are ``W @ X - offset[:, None]``: projection,
+    pre-whitening, PCA and unmixing folded into one matrix.
+    """
+    from mne._fiff.proj import make_projector
+
+    W = ica.unmixing_matrix_ @ ica.pca_components_[:ica.n_components_]
+    offset = W @ ica.pca_mean_ if ica.pca_mean_ is not None else np.zeros(len(W))
+    if ica.noise_cov is None:
+        W = W / ica.pre_whitener_.T
+        projs = [p for p in ica.info['projs'] if p['active']]
+        if projs:
+            proj, n_proj, _ = make_projector(projs, ica.info['ch_names'], include_active=True)
+            if n_proj:
+                W = W @ proj
+    else:
+        W = W @ ica.pre_whitener_  # includes the projection
+    return W, offset
+
+
+def reference_channels(raw, eog=None, ecg=None, proxies=True):
+    """
+    List of references ``(name, kind, weights)`` with ``weights`` a dict of
+    channel name -> weight. ``eog``/``ecg`` name the channels to use (None:
+    all good channels of that type); with no EOG channel and ``proxies``,
+    frontal proxies are added.
+    """
+    import mne
+
+    bads = set(raw.info['bads'])
+    refs = []
+    for kind, names in (('eog', eog), ('ecg', ecg)):
+        if names is None:
+            picks = mne.pick_types(raw.info, meg=False, **{kind: True}, exclude='bads')
+            names = [raw.ch_names[k] for k in picks]
+        elif isinstance(names, str):
+            names = [names]
+        for name in names:
+            if name not in raw.ch_names:
+                raise ValueError("{} channel {!r} not in the recording".format(
+                    kind.upper(), name))
+            refs.append((name, kind, {name: 1.}))
+    if proxies and not any(kind == 'eog' for _, kind, _ in refs):
+        good = [ch for ch in raw.ch_names if ch not in bads]
+        lower = {ch.lower(): ch for ch in good}
+        for tier in VEOG_PROXIES:
+            chs = [lower[ch.lower()] for ch in tier if ch.lower() in lower]
+            if chs:
+                refs.append(('VEOG~' + '+'.join(chs), 'eog', {ch: 1. / len(chs) for ch in chs}))
+                break
+        for left, right in HEOG_PROXIES:
+            if left.lower() in lower and right.lower() in lower:
+                left, right = lower[left.lower()], lower[right.lower()]
+                refs.append(('HEOG~{}-{}'.format(left, right), 'eog', {left: 1., right: -1.}))
+                break
+    return refs
+
+
+def scoring_filter(sfreq, l_freq, h_freq):
+    """
+    Zero-phase band-pass kernel equivalent to the filter ICA.score_sources()
+    applies (firwin2, 10 s, 0.5 Hz transitions, applied twice).
+    """
+    import mne
+
+    h = mne.filter.create_filter(None, sfreq, l_freq, h_freq, filter_length='10s',
+                                 l_trans_bandwidth=0.5, h_trans_bandwidth=0.5,
+                                 fir_window='hann', fir_design='firwin2',
+                                 phase='zero-double', verbose=False)
+    # Forward then backward pass in one kernel.
+    return np.convolve(h, h[::-1])
+
+
+# ------------------------------------------------------------------
+# Step 2: Chunked Source Correlation
+# ------------------------------------------------------------------
+def _good_samples(raw, start, stop):
+    # False inside 'bad*' annotations (samples relative to the first sample).
+    from mne_annotation_index import AnnotationIndex
+
+    keep = np.ones(stop - start, bool)
+    sfreq = raw.info['sfreq']
+    for t0, t1 in AnnotationIndex.from_raw(raw).bad_segments():
+        s0 = max(int(round(t0 * sfreq)) - start, 0)
+        s1 = min(int(round(t1 * sfreq)) - start, stop - start)
+        keep[s0:s1] = False
+    return keep
+
+
+def correlate_sources(ica, raw, references, start=None, stop=None, chunk_duration=60.,
+                      reject_by_annotation=True):
+    """
+    Pearson correlation (n_references, n_components) of the band-limited ICA
+    sources with every reference of reference_channels(). The data are read
+    once, in chunks of ``chunk_duration`` seconds padded by half the filter
+    length, so each chunk is filtered exactly as the whole recording would be.
+    """
+    from scipy.signal import oaconvolve
+
+    sfreq = raw.info['sfreq']
+    start = 0 if start is None else start
+    stop = raw.n_times if stop is None else min(stop, raw.n_times)
+    W, offset = unmixing_operator(ica)
+    n_comp = len(W)
+    ch_names = list(ica.ch_names)
+    for _, _, weights in references:
+        ch_names += [ch for ch in weights if ch not in ch_names]
+    picks = np.array([raw.ch_names.index(ch) for ch in ch_names])
+    row = {ch: k for k, ch in enumerate(ch_names)}
+
+    # One operator and one kernel per band: rows are the sources followed by
+    # the references scored in that band.
+    bands = []
+    for kind in sorted({kind for _, kind, _ in references}):
+        refs = [k for k, ref in enumerate(references) if ref[1] == kind]
+        A = np.zeros((n_comp + len(refs), len(ch_names)))
+        A[:n_comp, :W.shape[1]] = W
+        for i, k in enumerate(refs):
+            for ch, weight in references[k][2].items():
+                A[n_comp + i, row[ch]] += weight
+        h = scoring_filter(sfreq, *BANDS[kind])
+        bands.append(dict(refs=refs, A=A, h=h, sums=np.zeros(len(A)),
+                          squares=np.zeros(len(A)), cross=np.zeros((n_comp, len(refs)))))
+    pad = max(len(band['h']) // 2 for band in bands) if bands else 0
+    keep = _good_samples(raw, start, stop) if reject_by_annotation else \
+        np.ones(stop - start, bool)
+    chunk = max(1, int(chunk_duration * sfreq))
+    for c0 in range(start, stop, chunk):
+        c1 = min(c0 + chunk, stop)
+        mask = keep[c0 - start:c1 - start]
+        if not mask.any():
+            continue
+        lo, hi = max(start, c0 - pad), min(stop, c1 + pad)
+        data = raw.get_data(picks=picks, start=lo, stop=hi)
+        # Reflect at the ends of the scored range, as filter_data() pads.
+        left, right = pad - (c0 - lo), pad - (hi - c1)
+        if left or right:
+            data = np.pad(data, ((0, 0), (left, right)),
+                          mode='reflect' if data.shape[1] > max(left, right) else 'edge')
+        for band in bands:
+            signals = band['A'] @ data
+            signals[:n_comp] -= offset[:, None]
+            trim = pad - len(band['h']) // 2
+            signals = oaconvolve(signals[:, trim:signals.shape[1] - trim],
+                                 band['h'][None], mode='valid', axes=1)[:, mask]
+            band['sums'] += signals.sum(axis=1)
+            band['squares'] += np.einsum('ij,ij->i', signals, signals)
+            band['cross'] += signals[:n_comp] @ signals[n_comp:].T
+    n = keep.sum()
+    scores = np.zeros((len(references), n_comp))
+    for band in bands:
+        mean = band['sums'] / n
+        std = np.sqrt(np.maximum(band['squares'] / n - mean ** 2, 0.))
+        cov = band['cross'] / n - np.outer(mean[:n_comp], mean[n_comp:])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = cov / np.outer(std[:n_comp], std[n_comp:])
+        scores[band['refs']] = np.nan_to_num(r).T
+    return scores
+
+
+# ------------------------------------------------------------------
+# Step 3: Iterative Z-Scoring and Component Selection
+# ------------------------------------------------------------------
+def find_outliers(scores, threshold=3., max_iter=2):
+    """
+    Indices whose |z-score| exceeds ``threshold``; the z-scores are
+    recomputed without the outliers found so far, up to ``max_iter`` times.
+    """
+    scores = np.asarray(scores, float)
+    bad = np.zeros(len(scores), bool)
+    for _ in range(max_iter):
+        rest = scores[~bad]
+        std = rest.std()
+        if not len(rest) or std == 0:
+            break
+        new = ~bad & (np.abs(scores - rest.mean()) / std > threshold)
+        if not new.any():
+            break
+        bad |= new
+    return np.flatnonzero(bad)
+
+
+def find_artifact_components(ica, raw, eog=None, ecg=None, proxies=True, threshold=3.,
+                             max_iter=2, start=None, stop=None, chunk_duration=60.,
+                             reject_by_annotation=True):
+    """
+    Score all ICA components against all EOG/ECG references (see
+    reference_channels()) and return ``exclude, scores``: the outlier
+    components of every reference, ordered by |correlation|, and a dict of
+    reference name -> correlation per component. ``ica.labels_`` is updated
+    as by ica.find_bads_eog()/find_bads_ecg().
+    """
+    from mne.utils import logger
+
+    references = reference_channels(raw, eog=eog, ecg=ecg, proxies=proxies)
+    if not references:
+        logger.warning("No EOG/ECG channels or frontal proxies found; no components "
+                       "scored.")
+        return [], dict()
+    scores = correlate_sources(ica, raw, references, start=start, stop=stop,
+                               chunk_duration=chunk_duration,
+                               reject_by_annotation=reject_by_annotation)
+    found, best = dict(), dict()
+    for k, ((name, kind, _), score) in enumerate(zip(references, scores)):
+        idx = find_outliers(score, threshold=threshold, max_iter=max_iter)
+        ica.labels_['{}/{}/{}'.format(kind, k, name)] = [int(i) for i in idx]
+        for i in idx:
+            found.setdefault(kind, set()).add(int(i))
+            best[int(i)] = max(best.get(int(i), 0.), abs(score[i]))
+    for kind in ('eog', 'ecg'):
+        ica.labels_[kind] = sorted(found.get(kind, ()), key=lambda i: -best[i])
+    exclude = sorted(best, key=lambda i: -best[i])
+    logger.info("ICA artifact scoring: {} components x {} references ({}) -> exclude {}".format(
+        len(scores[0]), len(references), ', '.join(name for name, _, _ in references),
+        exclude))
+    return exclude, {name: score for (name, _, _), score in zip(references, scores)}
@@ -0,0 +1,348 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# ------------------------------------------------------------------
+# Per-stage profiling and memory instrumentation
+# ------------------------------------------------------------------
+# Context-managed spans around pipeline stages:
+#
+#   from mne_instrumentation import configure, span
+#   configure('trace.json')             # or configure_from_env()
+#   with span('filter', l_freq=1, h_freq=40):
+#       raw.filter(1, 40)
+#
+# Each span records wall time, CPU time, RSS at start/end, peak RSS while it
+# was open and the bytes read/written by the process. Spans are written as
+# JSON lines (``.jsonl``) or as a Chrome trace (``.json``, open it in
+# chrome://tracing or https://ui.perfetto.dev). ``profile=True`` additionally
+# runs the pyinstrument sampling profiler for the whole session.
+#
+# Until configure() is called, span() returns a shared no-op object, so
+# instrumented code costs one function call per span. This module only
+# imports the standard library (psutil is used when installed).
+
+# Environment variables read by configure_from_env().
+TRACE_ENV = 'PIPELINE_TRACE'
+PROFILE_ENV = 'PIPELINE_PROFILE'
+
+_TRACER = None
+
+
+# ------------------------------------------------------------------
+# Step 1: Process Counters
+# ------------------------------------------------------------------
+def _rss_reader():
+    """Return a function giving the current RSS in bytes."""
+    try:
+        import psutil
+        proc = psutil.Process()
+        return lambda: proc.memory_info().rss
+    except ImportError:
+        pass
+    if os.path.exists('/proc/self/statm'):
+        page = os.sysconf('SC_PAGE_SIZE')
+
+        def read_statm():
+            with open('/proc/self/statm') as fid:
+                return int(fid.read().split()[1]) * page
+        return read_statm
+    import resource  # peak only, but better than nothing
+    return lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _io_reader():
+    """
+    Return a function giving (bytes read, bytes written) by this process
+    through read()/write() calls, or None when not available.
+    """
+    if os.path.exists('/proc/self/io'):
+        def read_proc_io():
+            with open('/proc/self/io') as fid:
+                fields = dict(line.split(':') for line in fid.read().splitlines())
+            return int(fields['rchar']), int(fields['wchar'])
+        return read_proc_io
+    try:
+        import psutil
+        proc = psutil.Process()
+        proc.io_counters()
+    except (ImportError, AttributeError, OSError):
+        return None
+    return lambda: (proc.io_counters().read_chars, proc.io_counters().write_chars)
+
+
+class PeakRSS:
+    """
+    Background thread sampling the RSS every ``interval`` seconds. Records
+    registered with track() get their ``rss_peak`` raised to the largest
+    value seen while tracked. Also usable on its own as a context manager
+    (``start``/``peak`` attributes, in bytes).
+    """
+
+    def __init__(self, interval=0.005, read_rss=None):
+        self.interval = interval
+        self.read_rss = read_rss or _rss_reader()
+        self._records = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self.read_rss()
+            with self._lock:
+                for record in self._records:
+                    if rss > record['rss_peak']:
+                        record['rss_peak'] = rss
+
+    def start_thread(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop_thread(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def track(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def untrack(self, record):
+        with self._lock:
+            self._records.remove(record)
+
+    def __enter__(self):
+        self._self_record = dict(rss_peak=self.read_rss())
+        self.start = self._self_record['rss_peak']
+        self.track(self._self_record)
+        self.start_thread()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_thread()
+        self.untrack(self._self_record)
+        self.peak = max(self._self_record['rss_peak'], self.read_rss())
+
+
+# ------------------------------------------------------------------
+# Step 2: Spans
+# ------------------------------------------------------------------
+class _NullSpan:
+    """Returned by span() while instrumentation is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.record = dict(name=name, **attrs)
+
+    def set(self, **attrs):
+        """Attach extra attributes (e.g. results) to the span."""
+        self.record.update(attrs)
+
+    def __enter__(self):
+        tracer, record = self.tracer, self.record
+        stack = tracer._stack()
+        record['parent'] = stack[-1].record['name'] if stack else None
+        record['depth'] = len(stack)
+        stack.append(self)
+        if tracer.memory:
+            record['rss_start'] = record['rss_peak'] = tracer.read_rss()
+            tracer.sampler.track(record)
+        if tracer.read_io is not None:
+            self._io0 = tracer.read_io()
+        self._cpu0 = time.process_time_ns()
+        self._t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t1 = time.perf_counter_ns()
+        cpu1 = time.process_time_ns()
+        tracer, record = self.tracer, self.record
+        record['wall_s'] = (t1 - self._t0) / 1e9
+        record['cpu_s'] = (cpu1 - self._cpu0) / 1e9
+        record['start_us'] = (self._t0 - tracer.t0) / 1e3
+        if tracer.read_io is not None:
+            read1, written1 = tracer.read_io()
+            record['bytes_read'] = read1 - self._io0[0]
+            record['bytes_written'] = written1 - self._io0[1]
+        if tracer.memory:
+            tracer.sampler.untrack(record)
+            record['rss_end'] = tracer.read_rss()
+            record['rss_peak'] = max(record['rss_peak'], record['rss_end'])
+            record['rss_delta'] = record['rss_end'] - record['rss_start']
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        tracer._stack().pop()
+        tracer.emit(record)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Context manager timing the enclosed block as stage ``name``; keyword
+    arguments are stored with the span. A no-op until configure() is called.
+    """
+    if _TRACER is None:
+        return _NULL_SPAN
+    return _Span(_TRACER, name, attrs)
+
+
+def traced(name=None):
+    """Decorator wrapping every call of a function in a span."""
+    def decorator(func):
+        label = name or func.__name__
+
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        wrapper.__name__, wrapper.__doc__ = func.__name__, func.__doc__
+        return wrapper
+    return decorator
+
+
+# ------------------------------------------------------------------
+# Step 3: Tracer and Output Formats
+# ------------------------------------------------------------------
+class Tracer:
+    """
+    Collects finished spans. ``fmt='jsonl'`` appends one JSON object per span
+    to ``output`` as soon as the span ends; ``fmt='chrome'`` keeps the spans
+    and writes a Chrome trace file on close(). ``output=None`` only keeps
+    the spans in ``records``.
+    """
+
+    def __init__(self, output=None, fmt=None, memory=True, sample_interval=0.005,
+                 profile=False):
+        if fmt is None:
+            fmt = 'chrome' if output is not None and output.endswith('.json') else 'jsonl'
+        if fmt not in ('jsonl', 'chrome'):
+            raise ValueError("fmt must be 'jsonl' or 'chrome', got {!r}".format(fmt))
+        self.output, self.fmt, self.memory = output, fmt, memory
+        self.records = []
+        self.t0 = time.perf_counter_ns()
+        self.wall0 = time.time()
+        self.pid = os.getpid()
+        self._local = threading.local()
+        self.read_io = _io_reader()
+        if memory:
+            self.read_rss = _rss_reader()
+            self.sampler = PeakRSS(sample_interval, self.read_rss)
+            self.sampler.start_thread()
+        self._fid = open(output, 'a') if output is not None and fmt == 'jsonl' else None
+        self.profiler = None
+        if profile:
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ImportError("profile=True needs pyinstrument (pip install pyinstrument)")
+            self.profiler = Profiler(interval=0.001)
+            self.profiler.start()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def emit(self, record):
+        record = dict(record, pid=self.pid, tid=threading.get_ident(),
+                      timestamp=self.wall0 + record['start_us'] / 1e6)
+        self.records.append(record)
+        if self._fid is not None:
+            self._fid.write(json.dumps(record, default=str) + '\n')
+            self._fid.flush()
+
+    def chrome_events(self):
+        """The spans as Chrome trace 'complete' events."""
+        events = []
+        for record in self.records:
+            args = {k: v for k, v in record.items()
+                    if k not in ('name', 'pid', 'tid', 'start_us', 'wall_s')}
+            events.append(dict(name=record['name'], ph='X', ts=record['start_us'],
+                               dur=record['wall_s'] * 1e6, pid=record['pid'],
+                               tid=record['tid'], args=args))
+        return events
+
+    def close(self):
+        if self.memory:
+            self.sampler.stop_thread()
+        if self._fid is not None:
+            self._fid.close()
+            self._fid = None
+        if self.output is not None and self.fmt == 'chrome':
+            with open(self.output, 'w') as fid:
+                json.dump(dict(traceEvents=self.chrome_events(), displayTimeUnit='ms'),
+                          fid, default=str)
+        if self.profiler is not None:
+            self.profiler.stop()
+            base = os.path.splitext(self.output or 'pipeline')[0]
+            with open(base + '-profile.html', 'w') as fid:
+                fid.write(self.profiler.output_html())
+            self.profiler = None
+
+
+def configure(output=None, fmt=None, memory=True, sample_interval=0.005, profile=False):
+    """
+    Enable instrumentation (replacing any previous configuration) and return
+    the Tracer. The trace is finalized by disable() or at interpreter exit.
+    """
+    global _TRACER
+    disable()
+    _TRACER = Tracer(output, fmt=fmt, memory=memory, sample_interval=sample_interval,
+                     profile=profile)
+    return _TRACER
+
+
+def configure_from_env():
+    """
+    Enable instrumentation if the PIPELINE_TRACE environment variable names
+    an output file (.json: Chrome trace, .jsonl: JSON lines);
+    PIPELINE_PROFILE=1 also attaches the sampling profiler.
+    """
+    output = os.environ.get(TRACE_ENV)
+    if not output:
+        return None
+    return configure(output, profile=os.environ.get(PROFILE_ENV, '') not in ('', '0'))
+
+
+def disable():
+    """Finalize the current trace and turn instrumentation off."""
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def summary(records):
+    """Short text table (one line per span) of a list of span records."""
+    lines = ['{:<28s} {:>9s} {:>9s} {:>10s} {:>10s} {:>11s}'.format(
+        'stage', 'wall (s)', 'cpu (s)', 'peak (MB)', 'delta (MB)', 'read (MB)')]
+    for record in records:
+        lines.append('{:<28s} {:9.3f} {:9.3f} {:10.1f} {:10.1f} {:11.1f}'.format(
+            '  ' * record.get('depth', 0) + record['name'], record['wall_s'], record['cpu_s'],
+            record.get('rss_peak', 0) / 1e6, record.get('rss_delta', 0) / 1e6,
+            record.get('bytes_read', 0) / 1e6))
+    return '\n'.join(lines)
+
+
+atexit.register(disable)
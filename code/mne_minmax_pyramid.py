@@ -0,0 +1,243 @@
+import os
+import numpy as np
+
+# ------------------------------------------------------------------
+# Level-of-detail min/max pyramid for browsing long recordings
+# ------------------------------------------------------------------
+# raw.plot() resamples the raw samples on every redraw, which is slow for
+# multi-hour files. Here a min/max envelope is computed once per recording in
+# a single streaming pass and saved next to the data file. Level 0 holds the
+# min and max of every ``base_bin`` samples; each further level merges
+# ``factor`` bins of the level below. A view then reads the level whose bin
+# size matches the on-screen pixel density, so drawing a full-length view
+# costs the same no matter how long the recording is.
+
+
+# ------------------------------------------------------------------
+# Step 1: Build the Pyramid in One Streaming Pass
+# ------------------------------------------------------------------
+def _reduce_level(mins, maxs, factor):
+    # Merge groups of ``factor`` bins; the last group may be shorter.
+    starts = np.arange(0, mins.shape[1], factor)
+    return (np.minimum.reduceat(mins, starts, axis=1),
+            np.maximum.reduceat(maxs, starts, axis=1))
+
+
+def build_pyramid(raw, base_bin=16, factor=4, min_bins=256,
+                  chunk_duration=60., dtype=np.float32):
+    """
+    Compute the min/max pyramid of a Raw object. The data are read in chunks
+    of about ``chunk_duration`` seconds, so ``raw`` does not need to be
+    preloaded. Returns a dict with one (min, max) array pair per level.
+    """
+    sfreq = raw.info['sfreq']
+    n_times = raw.n_times
+    # Chunks are a whole number of level-0 bins so no bin straddles chunks.
+    chunk = max(1, int(chunk_duration * sfreq) // base_bin) * base_bin
+
+    mins, maxs = [], []
+    for start in range(0, n_times, chunk):
+        stop = min(start + chunk, n_times)
+        data = raw.get_data(start=start, stop=stop)
+        starts = np.arange(0, stop - start, base_bin)
+        mins.append(np.minimum.reduceat(data, starts, axis=1).astype(dtype))
+        maxs.append(np.maximum.reduceat(data, starts, axis=1).astype(dtype))
+    levels = [(np.concatenate(mins, axis=1), np.concatenate(maxs, axis=1))]
+    bin_sizes = [base_bin]
+    while levels[-1][0].shape[1] > min_bins:
+        levels.append(_reduce_level(*levels[-1], factor))
+        bin_sizes.append(bin_sizes[-1] * factor)
+
+    return dict(levels=levels, bin_sizes=np.array(bin_sizes), sfreq=sfreq,
+                n_times=n_times, ch_names=list(raw.ch_names))
+
+
+# ------------------------------------------------------------------
+# Step 2: Persist the Pyramid Beside the Data
+# ------------------------------------------------------------------
+def pyramid_fname(data_fname):
+    """Return the pyramid cache file used for ``data_fname``."""
+    return os.path.splitext(data_fname)[0] + '-minmax.npz'
+
+
+def _source_stamp(data_fname):
+    stat = os.stat(data_fname)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def save_pyramid(fname, pyramid, source_stamp=None):
+    """Save a pyramid to an .npz file."""
+    arrays = dict(bin_sizes=pyramid['bin_sizes'], sfreq=pyramid['sfreq'],
+                  n_times=pyramid['n_times'], ch_names=np.array(pyramid['ch_names']))
+    if source_stamp is not None:
+        arrays['source_stamp'] = source_stamp
+    for k, (lo, hi) in enumerate(pyramid['levels']):
+        arrays['min_{}'.format(k)] = lo
+        arrays['max_{}'.format(k)] = hi
+    np.savez(fname, **arrays)
+
+
+def read_pyramid(fname):
+    """Read a pyramid saved with save_pyramid()."""
+    with np.load(fname) as npz:
+        n_levels = len(npz['bin_sizes'])
+        pyramid = dict(
+            levels=[(npz['min_{}'.format(k)], npz['max_{}'.format(k)]) for k in range(n_levels)],
+            bin_sizes=npz['bin_sizes'], sfreq=float(npz['sfreq']),
+            n_times=int(npz['n_times']), ch_names=npz['ch_names'].tolist())
+        pyramid['source_stamp'] = npz['source_stamp'] if 'source_stamp' in npz else None
+    return pyramid
+
+
+def load_or_build_pyramid(raw, data_fname=None, **kwargs):
+    """
+    Return the pyramid for ``raw``, reading it from beside the data file
+    when a cache exists for the same file, otherwise building and saving it.
+    """
+    if data_fname is None:
+        data_fname = str(raw.filenames[0])
+    fname = pyramid_fname(data_fname)
+    stamp = _source_stamp(data_fname)
+    if os.path.exists(fname):
+        pyramid = read_pyramid(fname)
+        if (pyramid['source_stamp'] is not None
+                and np.array_equal(pyramid['source_stamp'], stamp)
+                and pyramid['n_times'] == raw.n_times
+                and pyramid['ch_names'] == list(raw.ch_names)):
+            return pyramid
+    pyramid = build_pyramid(raw, **kwargs)
+    save_pyramid(fname, pyramid, source_stamp=stamp)
+    return pyramid
+
+
+# ------------------------------------------------------------------
+# Step 3: Read the Envelope for a View
+# ------------------------------------------------------------------
+def select_level(pyramid, tmin, tmax, n_pixels):
+    """
+    Return the coarsest level whose bins are still no wider than one pixel
+    for the window [tmin, tmax], or None when even level 0 is too coarse
+    (the window is short enough to draw the raw samples).
+    """
+    samples_per_pixel = (tmax - tmin) * pyramid['sfreq'] / max(n_pixels, 1)
+    fits = np.flatnonzero(pyramid['bin_sizes'] <= samples_per_pixel)
+    return int(fits[-1]) if len(fits) else None
+
+
+def get_envelope(pyramid, tmin, tmax, n_pixels, picks=None):
+    """
+    Return ``(times, mins, maxs)`` for the window [tmin, tmax] with at most
+    ``n_pixels`` columns, read from the matching pyramid level. ``times`` are
+    the start times of the columns. Returns None when the window needs raw
+    samples (see select_level()).
+    """
+    level = select_level(pyramid, tmin, tmax, n_pixels)
+    if level is None:
+        return None
+    bin_size = pyramid['bin_sizes'][level]
+    lo, hi = pyramid['levels'][level]
+    if picks is not None:
+        lo, hi = lo[picks], hi[picks]
+    first = max(0, int(tmin * pyramid['sfreq'] // bin_size))
+    last = min(lo.shape[1], int(np.ceil(tmax * pyramid['sfreq'] / bin_size)))
+    lo, hi = lo[:, first:last], hi[:, first:last]
+    # Merge the remaining bins down to at most n_pixels columns.
+    step = max(1, int(np.ceil(lo.shape[1] / n_pixels)))
+    if step > 1:
+        lo, hi = _reduce_level(lo, hi, step)
+    times = (first + np.arange(lo.shape[1]) * step) * bin_size / pyramid['sfreq']
+    return times, lo, hi
+
+
+# ------------------------------------------------------------------
+# Step 4: Draw and Browse
+# ------------------------------------------------------------------
+def plot_envelope(raw, pyramid, tmin, tmax, picks=None, ax=None, spacing=None):
+    """
+    Draw channels ``picks`` between ``tmin`` and ``tmax`` on ``ax``, using the
+    pyramid level that matches the axes width in pixels and falling back to
+    the raw samples for short windows.
+    """
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        _, ax = plt.subplots(figsize=(12, 8))
+    if picks is None:
+        picks = np.arange(min(20, len(pyramid['ch_names'])))
+    picks = np.asarray(picks)
+    n_pixels = int(ax.get_window_extent().width) or 1000
+    tmin, tmax = max(tmin, 0.), min(tmax, pyramid['n_times'] / pyramid['sfreq'])
+
+    envelope = get_envelope(pyramid, tmin, tmax, n_pixels, picks=picks)
+    if envelope is None:
+        start, stop = raw.time_as_index([tmin, tmax], use_rounding=True)
+        data = raw.get_data(picks=picks, start=start, stop=stop)
+        times = (start + np.arange(data.shape[1])) / pyramid['sfreq']
+        lo = hi = data
+    else:
+        times, lo, hi = envelope
+    if spacing is None:
+        spacing = np.median(hi - lo) * 4 or 1.
+    offsets = -np.arange(len(picks))[:, None] * spacing
+
+    ax.clear()
+    for k in range(len(picks)):
+        if envelope is None:
+            ax.plot(times, lo[k] + offsets[k], color='k', lw=0.5)
+        else:
+            ax.fill_between(times, lo[k] + offsets[k], hi[k] + offsets[k],
+                            step='post', color='k', lw=0, alpha=0.8)
+    ax.set(xlim=(tmin, tmax), xlabel='Time (s)',
+           yticks=offsets[:, 0], yticklabels=[pyramid['ch_names'][p] for p in picks])
+    return ax
+
+
+def browse(raw, pyramid, duration=None, picks=None):
+    """
+    Minimal browser over the pyramid. Left/right arrows scroll by half a
+    page, up/down zoom in and out, Home shows the full recording.
+    """
+    import matplotlib.pyplot as plt
+
+    total = pyramid['n_times'] / pyramid['sfreq']
+    view = dict(tmin=0., width=total if duration is None else duration)
+    fig, ax = plt.subplots(figsize=(12, 8))
+
+    def redraw():
+        plot_envelope(raw, pyramid, view['tmin'], view['tmin'] + view['width'],
+                      picks=picks, ax=ax)
+        fig.canvas.draw_idle()
+
+    def on_key(event):
+        if event.key == 'right':
+            view['tmin'] = min(view['tmin'] + view['width'] / 2, max(total - view['width'], 0))
+        elif event.key == 'left':
+            view['tmin'] = max(view['tmin'] - view['width'] / 2, 0.)
+        elif event.key == 'up':
+            view['width'] = max(view['width'] / 2, 10. / pyramid['sfreq'])
+        elif event.key == 'down':
+            view['width'] = min(view['width'] * 2, total)
+        elif event.key == 'home':
+            view['tmin'], view['width'] = 0., total
+        else:
+            return
+        redraw()
+
+    fig.canvas.mpl_connect('key_press_event', on_key)
+    redraw()
+    return fig
+
+
+if __name__ == '__main__':
+    import mne
+    import matplotlib.pyplot as plt
+
+    # ------------------------------------------------------------------
+    # Example: Full-Length View of the Workshop Recording
+    # ------------------------------------------------------------------
+    set_file_path = 's17_1.set'
+    raw = mne.io.read_raw_eeglab(set_file_path, preload=False)
+    pyramid = load_or_build_pyramid(raw, set_file_path)
+    print("Pyramid levels (bin sizes in samples):", pyramid['bin_sizes'])
+    browse(raw, pyramid, picks=np.arange(min(32, len(raw.ch_names))))
+    plt.show()
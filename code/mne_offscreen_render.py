@@ -0,0 +1,219 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# ------------------------------------------------------------------
+# Parallel offscreen rendering of source movies and topomap sheets
+# ------------------------------------------------------------------
+# brain.save_movie() renders every frame serially in one interactive window.
+# Here frames (or whole subjects) are split across a process pool. Each
+# worker process sets up its own offscreen rendering context once (pyvista
+# off-screen for 3D, Agg for matplotlib), renders its share of frames to PNG
+# files, and the parent assembles the frames into the output movie.
+
+# Per-process state: the Brain a worker has already built, keyed by job.
+_WORKER_STATE = dict()
+
+
+# ------------------------------------------------------------------
+# Step 1: Offscreen Worker Setup
+# ------------------------------------------------------------------
+def _init_worker():
+    """
+    Pool initializer: switch this process to offscreen rendering before
+    anything opens a window.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import matplotlib
+    matplotlib.use('Agg')
+    try:
+        import pyvista
+    except ImportError:  # 2D-only workers (topomaps) do not need pyvista
+        return
+    pyvista.OFF_SCREEN = True
+
+
+def _n_jobs(n_jobs):
+    if n_jobs is None or n_jobs < 1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def _make_pool(n_jobs):
+    # 'spawn' because VTK/Qt state does not survive a fork.
+    return ProcessPoolExecutor(max_workers=_n_jobs(n_jobs), mp_context=get_context('spawn'),
+                               initializer=_init_worker)
+
+
+def _split(items, n_parts):
+    # Contiguous, nearly equal parts; empty parts are dropped.
+    return [part for part in np.array_split(np.asarray(items), n_parts) if len(part)]
+
+
+# ------------------------------------------------------------------
+# Step 2: Movie Frames
+# ------------------------------------------------------------------
+def movie_frame_times(stc, tmin=None, tmax=None, time_dilation=4., framerate=24):
+    """
+    Return the stc time (in seconds) of every movie frame, using the same
+    schedule as brain.save_movie().
+    """
+    tmin = stc.times[0] if tmin is None else tmin
+    tmax = stc.times[-1] if tmax is None else tmax
+    if tmin < stc.times[0] or tmax > stc.times[-1]:
+        raise ValueError("tmin/tmax ({}, {}) outside of the source estimate ({}, {})."
+                         .format(tmin, tmax, stc.times[0], stc.times[-1]))
+    n_frames = int(np.floor((tmax - tmin) * time_dilation * framerate))
+    if n_frames == 0:
+        raise ValueError("No time points selected")
+    return tmin + np.arange(n_frames) / (framerate * time_dilation)
+
+
+def _render_frames(job_key, stc, plot_kwargs, times, frame_ids, frame_dir,
+                   interpolation):
+    """
+    Worker: render ``times`` of ``stc`` to frame_dir/frame_<id>.png. The
+    Brain is built on the first call for ``job_key`` and reused afterwards.
+    """
+    import matplotlib.pyplot as plt
+
+    brain = _WORKER_STATE.get(job_key)
+    if brain is None:
+        brain = stc.plot(**dict(plot_kwargs, time_viewer=False, show=False))
+        if interpolation is not None:
+            brain.set_time_interpolation(interpolation)
+        _WORKER_STATE[job_key] = brain
+    time_idx = np.interp(times, stc.times, np.arange(len(stc.times)))
+    # The first screenshot can come out at a different size, discard it.
+    brain.screenshot()
+    fnames = []
+    for frame_id, idx in zip(frame_ids, time_idx):
+        brain.set_time_point(idx)
+        fname = os.path.join(frame_dir, 'frame_{:05d}.png'.format(frame_id))
+        plt.imsave(fname, brain.screenshot())
+        fnames.append(fname)
+    return fnames
+
+
+def assemble_movie(frame_fnames, fname, framerate=24, codec=None, bitrate=None):
+    """
+    Write the frames (PNG files, in order) to a movie with imageio, the
+    same writer brain.save_movie() uses.
+    """
+    try:
+        import imageio
+    except ImportError:
+        raise ImportError("Writing movies requires imageio (pip install imageio imageio-ffmpeg). "
+                          "The rendered frames are kept as PNG files.")
+    kwargs = dict(fps=framerate)
+    if codec is not None:
+        kwargs['codec'] = codec
+    if bitrate is not None:
+        kwargs['bitrate'] = bitrate
+    with imageio.get_writer(fname, **kwargs) as writer:
+        for frame in frame_fnames:
+            writer.append_data(imageio.imread(frame))
+    return fname
+
+
+def render_movie(stc, fname, tmin=None, tmax=None, time_dilation=4., framerate=24,
+                 interpolation='linear', n_jobs=None, frame_dir=None, **plot_kwargs):
+    """
+    Offscreen, parallel replacement for ``stc.plot(...).save_movie(...)``.
+
+    The frames are split into contiguous blocks, one per worker process;
+    each worker builds its own Brain with ``plot_kwargs`` (same arguments as
+    stc.plot()) and renders its block to PNG files in ``frame_dir`` (default:
+    a folder next to ``fname``). The frames are then assembled into
+    ``fname``. Returns the list of frame files.
+    """
+    times = movie_frame_times(stc, tmin, tmax, time_dilation, framerate)
+    if frame_dir is None:
+        frame_dir = os.path.splitext(fname)[0] + '_frames'
+    os.makedirs(frame_dir, exist_ok=True)
+
+    frame_ids = np.arange(len(times))
+    with _make_pool(n_jobs) as pool:
+        futures = [pool.submit(_render_frames, ('movie', fname), stc, plot_kwargs,
+                               times[ids], ids, frame_dir, interpolation)
+                   for ids in _split(frame_ids, _n_jobs(n_jobs))]
+        frame_fnames = [f for future in futures for f in future.result()]
+
+    assemble_movie(frame_fnames, fname, framerate=framerate)
+    return frame_fnames
+
+
+# ------------------------------------------------------------------
+# Step 3: Many Subjects at Once
+# ------------------------------------------------------------------
+def _render_subject_movie(job):
+    # Worker: a whole subject's movie in one process.
+    times = movie_frame_times(job['stc'], job.get('tmin'), job.get('tmax'),
+                              job.get('time_dilation', 4.), job.get('framerate', 24))
+    frame_dir = os.path.splitext(job['fname'])[0] + '_frames'
+    os.makedirs(frame_dir, exist_ok=True)
+    frame_fnames = _render_frames(('subject', job['fname']), job['stc'],
+                                  job.get('plot_kwargs', dict()), times,
+                                  np.arange(len(times)), frame_dir,
+                                  job.get('interpolation', 'linear'))
+    _WORKER_STATE.pop(('subject', job['fname'])).close()
+    assemble_movie(frame_fnames, job['fname'], framerate=job.get('framerate', 24))
+    return job['fname']
+
+
+def _render_topomap_sheet(job):
+    # Worker: one evoked -> one topomap sheet image.
+    import matplotlib.pyplot as plt
+
+    fig = job['evoked'].plot_topomap(times=job['times'], ch_type=job.get('ch_type'),
+                                     show=False, **job.get('plot_kwargs', dict()))
+    if job.get('title'):
+        fig.suptitle(job['title'])
+    fig.savefig(job['fname'], dpi=job.get('dpi', 150))
+    plt.close(fig)
+    return job['fname']
+
+
+def render_subject_movies(jobs, n_jobs=None):
+    """
+    Render one movie per job, subjects split across the pool. Each job is a
+    dict with ``stc`` and ``fname`` plus optional ``tmin``, ``tmax``,
+    ``time_dilation``, ``framerate``, ``interpolation`` and ``plot_kwargs``
+    (arguments of stc.plot(), e.g. ``subject`` and ``subjects_dir``).
+    """
+    with _make_pool(n_jobs) as pool:
+        return list(pool.map(_render_subject_movie, jobs))
+
+
+def render_topomap_sheets(jobs, n_jobs=None):
+    """
+    Save one topomap sheet per job in parallel. Each job is a dict with
+    ``evoked``, ``times`` and ``fname`` plus optional ``ch_type``, ``title``,
+    ``dpi`` and ``plot_kwargs`` (arguments of evoked.plot_topomap()).
+    """
+    with _make_pool(n_jobs) as pool:
+        return list(pool.map(_render_topomap_sheet, jobs))
+
+
+if __name__ == '__main__':
+    import mne
+
+    # ------------------------------------------------------------------
+    # Example: Headless sLORETA Movie and Topomap Sheet for the Sample Data
+    # ------------------------------------------------------------------
+    data_path = mne.datasets.sample.data_path()
+    subjects_dir = os.path.join(data_path, 'subjects')
+    meg_dir = os.path.join(data_path, 'MEG', 'sample')
+    evoked = mne.read_evokeds(os.path.join(meg_dir, 'sample_audvis-ave.fif'),
+                              condition=0, baseline=(None, 0))
+    inv_op = mne.minimum_norm.read_inverse_operator(
+        os.path.join(meg_dir, 'sample_audvis-meg-oct-6-meg-inv.fif'))
+    stc = mne.minimum_norm.apply_inverse(evoked, inv_op, lambda2=1 / 9., method='sLORETA')
+
+    render_topomap_sheets([dict(evoked=evoked, times=np.linspace(0.05, 0.15, 5),
+                                ch_type='mag', fname='sample_topomaps.png')])
+    frames = render_movie(stc, 'sample_sloreta.mp4', tmin=0.05, tmax=0.15,
+                          time_dilation=20, framerate=10, subject='sample',
+                          subjects_dir=subjects_dir, hemi='both', size=(800, 800))
+    print("Rendered {} frames to sample_sloreta.mp4".format(len(frames)))
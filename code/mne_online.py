@@ -0,0 +1,283 @@
+import time
+import numpy as np
+from scipy import signal
+
+# ------------------------------------------------------------------
+# Real-time (online) processing mode
+# ------------------------------------------------------------------
+# The offline scripts filter 1-40 Hz with a zero-phase FIR, re-reference to
+# the average and epoch around annotations of a finished recording. For
+# closed-loop sessions the same steps run block by block as data arrive:
+#
+#   StreamSimulator -> CausalBandpass -> average reference -> RingBuffer
+#                                                          -> OnlineEpocher
+#
+# Zero-phase filtering needs future samples, so the online filter is a causal
+# version of the same design (IIR Butterworth, or the offline firwin FIR
+# converted to minimum phase). Every block's processing latency and the
+# jitter of block arrival are recorded and reported as percentiles.
+
+
+# ------------------------------------------------------------------
+# Step 1: Fixed-Size Ring Buffer
+# ------------------------------------------------------------------
+class RingBuffer:
+    """
+    Fixed-size (n_channels, capacity) buffer addressed by absolute sample
+    index. Writing never allocates; reading returns a copy.
+    """
+
+    def __init__(self, n_channels, capacity, dtype=np.float64):
+        self.capacity = int(capacity)
+        self._data = np.zeros((n_channels, self.capacity), dtype)
+        self.n_written = 0  # absolute index of the next sample
+
+    def write(self, block):
+        n = block.shape[1]
+        if n > self.capacity:
+            block = block[:, -self.capacity:]
+            self.n_written += n - self.capacity
+            n = self.capacity
+        pos = self.n_written % self.capacity
+        first = min(n, self.capacity - pos)
+        self._data[:, pos:pos + first] = block[:, :first]
+        self._data[:, :n - first] = block[:, first:]
+        self.n_written += n
+
+    @property
+    def oldest(self):
+        """Absolute index of the oldest sample still in the buffer."""
+        return max(0, self.n_written - self.capacity)
+
+    def read(self, start, stop):
+        """Return samples [start, stop) (absolute indices)."""
+        if start < self.oldest or stop > self.n_written or start > stop:
+            raise ValueError("Samples [{}, {}) not in buffer (holds [{}, {}))."
+                             .format(start, stop, self.oldest, self.n_written))
+        idx = np.arange(start, stop) % self.capacity
+        return self._data[:, idx]
+
+
+# ------------------------------------------------------------------
+# Step 2: Causal Filter and Reference
+# ------------------------------------------------------------------
+class CausalBandpass:
+    """
+    Block-wise causal band-pass keeping the filter state between blocks.
+
+    ``method='iir'`` uses a Butterworth (``order``) in second-order
+    sections; ``method='fir'`` uses the same firwin design as
+    raw.filter(fir_design='firwin') converted to minimum phase. Both are
+    designed with mne.filter.create_filter().
+    """
+
+    def __init__(self, sfreq, l_freq, h_freq, n_channels, method='iir', order=4):
+        import mne
+
+        self.method = method
+        if method == 'iir':
+            params = mne.filter.create_filter(
+                None, sfreq, l_freq, h_freq, method='iir',
+                iir_params=dict(order=order, ftype='butter', output='sos'), verbose=False)
+            self.sos = params['sos']
+            self._zi = np.zeros((self.sos.shape[0], n_channels, 2))
+        elif method == 'fir':
+            self.h = mne.filter.create_filter(
+                None, sfreq, l_freq, h_freq, method='fir', fir_design='firwin',
+                phase='minimum', verbose=False)
+            self._zi = np.zeros((n_channels, len(self.h) - 1))
+        else:
+            raise ValueError("method must be 'iir' or 'fir', got {!r}".format(method))
+
+    def __call__(self, block):
+        if self.method == 'iir':
+            out, self._zi = signal.sosfilt(self.sos, block, axis=-1, zi=self._zi)
+        else:
+            out, self._zi = signal.lfilter(self.h, 1., block, axis=-1, zi=self._zi)
+        return out
+
+
+def average_reference(block, picks):
+    """Subtract the mean of channels ``picks`` from those channels (in place)."""
+    block[picks] -= block[picks].mean(axis=0, keepdims=True)
+    return block
+
+
+# ------------------------------------------------------------------
+# Step 3: Marker-Triggered Epoch Extraction
+# ------------------------------------------------------------------
+class OnlineEpocher:
+    """
+    Collects markers (absolute sample, event code) and cuts an epoch from
+    the ring buffer as soon as its last sample (``tmax``) has been written.
+    Markers whose epoch has already left the buffer are dropped and counted.
+    """
+
+    def __init__(self, buffer, sfreq, tmin, tmax, baseline=(None, 0)):
+        self.buffer = buffer
+        self.sfreq = sfreq
+        self.start_offset = int(round(tmin * sfreq))
+        self.stop_offset = int(round(tmax * sfreq)) + 1
+        if self.stop_offset - self.start_offset > buffer.capacity:
+            raise ValueError("Epoch ({} samples) does not fit in the ring buffer ({} samples)."
+                             .format(self.stop_offset - self.start_offset, buffer.capacity))
+        self.times = np.arange(self.start_offset, self.stop_offset) / sfreq
+        self._baseline = None
+        if baseline is not None:
+            bmin = self.times[0] if baseline[0] is None else baseline[0]
+            bmax = self.times[-1] if baseline[1] is None else baseline[1]
+            self._baseline = (self.times >= bmin) & (self.times <= bmax)
+        self._pending = []
+        self.n_dropped = 0
+
+    def add_markers(self, markers):
+        """Queue markers, an (n, 2) array of (absolute sample, code)."""
+        self._pending.extend((int(s), int(c)) for s, c in markers)
+
+    def pop_ready(self):
+        """Return the list of (sample, code, epoch data) that became complete."""
+        ready, waiting = [], []
+        for sample, code in self._pending:
+            start, stop = sample + self.start_offset, sample + self.stop_offset
+            if stop > self.buffer.n_written:
+                waiting.append((sample, code))
+            elif start < self.buffer.oldest or start < 0:
+                self.n_dropped += 1
+            else:
+                data = self.buffer.read(start, stop)
+                if self._baseline is not None:
+                    data -= data[:, self._baseline].mean(axis=1, keepdims=True)
+                ready.append((sample, code, data))
+        self._pending = waiting
+        return ready
+
+
+# ------------------------------------------------------------------
+# Step 4: Stream Simulator
+# ------------------------------------------------------------------
+class StreamSimulator:
+    """
+    Replays a Raw object in blocks of ``block_duration`` seconds at real
+    speed (``speed=1``; use a larger value to replay faster, or None for as
+    fast as possible). Each iteration yields (block, markers, release time),
+    where markers are the (absolute sample, code) events inside the block.
+    The raw data do not need to be preloaded.
+    """
+
+    def __init__(self, raw, block_duration=0.05, speed=1., event_id=None):
+        import mne
+
+        self.raw = raw
+        self.sfreq = raw.info['sfreq']
+        self.block_size = max(1, int(round(block_duration * self.sfreq)))
+        self.speed = speed
+        if len(raw.annotations):
+            events, self.event_id = mne.events_from_annotations(
+                raw, event_id=event_id, verbose=False)
+            self.events = events[:, [0, 2]] - [raw.first_samp, 0]
+        else:
+            self.events, self.event_id = np.zeros((0, 2), int), dict()
+
+    def __iter__(self):
+        n_times = self.raw.n_times
+        t0 = time.perf_counter()
+        for start in range(0, n_times, self.block_size):
+            stop = min(start + self.block_size, n_times)
+            if self.speed is not None:
+                # Block is available once its last sample has been recorded.
+                release = t0 + stop / self.sfreq / self.speed
+                delay = release - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            block = self.raw.get_data(start=start, stop=stop)
+            lo, hi = np.searchsorted(self.events[:, 0], [start, stop])
+            yield block, self.events[lo:hi], time.perf_counter()
+
+
+# ------------------------------------------------------------------
+# Step 5: Online Pipeline and Latency Report
+# ------------------------------------------------------------------
+class OnlinePipeline:
+    """
+    Online equivalent of the offline steps: causal band-pass, average
+    reference over EEG channels, ring buffer and marker-locked epochs.
+    ``process()`` takes one block with its markers and returns the epochs
+    that completed; per-block latency is recorded in ``latencies``.
+    """
+
+    def __init__(self, info, l_freq=1., h_freq=40., method='iir', reference='average',
+                 tmin=-0.2, tmax=0.8, baseline=(None, 0), buffer_duration=10.):
+        import mne
+
+        sfreq = info['sfreq']
+        n_channels = len(info['ch_names'])
+        self.filter = CausalBandpass(sfreq, l_freq, h_freq, n_channels, method=method)
+        self.ref_picks = (mne.pick_types(info, eeg=True, exclude='bads')
+                          if reference == 'average' else None)
+        self.buffer = RingBuffer(n_channels, int(buffer_duration * sfreq))
+        self.epocher = OnlineEpocher(self.buffer, sfreq, tmin, tmax, baseline)
+        self.latencies = []
+        self.arrivals = []
+
+    def process(self, block, markers=(), arrival=None):
+        arrival = time.perf_counter() if arrival is None else arrival
+        data = self.filter(block)
+        if self.ref_picks is not None and len(self.ref_picks):
+            average_reference(data, self.ref_picks)
+        self.buffer.write(data)
+        self.epocher.add_markers(markers)
+        epochs = self.epocher.pop_ready()
+        self.latencies.append(time.perf_counter() - arrival)
+        self.arrivals.append(arrival)
+        return epochs
+
+    def latency_report(self, block_duration=None, percentiles=(50, 95, 99)):
+        """
+        Percentiles (in ms) of per-block processing latency and, when
+        ``block_duration`` is given, of arrival jitter (deviation of the
+        interval between blocks from the nominal block duration).
+        """
+        report = dict(n_blocks=len(self.latencies))
+        lat = np.array(self.latencies) * 1e3
+        for p in percentiles:
+            report['latency_p{}_ms'.format(p)] = float(np.percentile(lat, p))
+        report['latency_max_ms'] = float(lat.max())
+        if block_duration is not None and len(self.arrivals) > 1:
+            jitter = np.abs(np.diff(self.arrivals) - block_duration) * 1e3
+            for p in percentiles:
+                report['jitter_p{}_ms'.format(p)] = float(np.percentile(jitter, p))
+            report['jitter_max_ms'] = float(jitter.max())
+        report['epochs_dropped'] = self.epocher.n_dropped
+        return report
+
+
+def run_online(raw, block_duration=0.05, speed=1., event_id=None, **kwargs):
+    """
+    Replay ``raw`` through an OnlinePipeline. Returns the list of
+    (sample, code, data) epochs, the event_id dict and the latency report.
+    """
+    stream = StreamSimulator(raw, block_duration=block_duration, speed=speed,
+                             event_id=event_id)
+    pipeline = OnlinePipeline(raw.info, **kwargs)
+    epochs = []
+    for block, markers, arrival in stream:
+        epochs.extend(pipeline.process(block, markers, arrival))
+    nominal = stream.block_size / stream.sfreq / speed if speed else None
+    return epochs, stream.event_id, pipeline.latency_report(block_duration=nominal)
+
+
+if __name__ == '__main__':
+    import mne
+
+    # ------------------------------------------------------------------
+    # Example: Replay the Workshop Recording as a Live Stream
+    # ------------------------------------------------------------------
+    set_file_path = 's17_1.set'
+    raw = mne.io.read_raw_eeglab(set_file_path, preload=False)
+    epochs, event_id, report = run_online(raw, block_duration=0.05, speed=1.,
+                                          l_freq=1., h_freq=40., tmin=-0.2, tmax=0.8)
+    codes = {code: name for name, code in event_id.items()}
+    n_encoding = sum(codes.get(code) == 'Encoding' for _, code, _ in epochs)
+    print("Online epochs extracted:", len(epochs), "(Encoding: {})".format(n_encoding))
+    for key, value in report.items():
+        print("  {}: {}".format(key, value))
@@ -0,0 +1,352 @@
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# ------------------------------------------------------------------
+# Pipeline-wide sample precision (float32 / float64)
+# ------------------------------------------------------------------
+# MNE keeps Raw and Epochs data in whatever dtype they were loaded in, but
+# its readers, filters, average() and apply_inverse() produce float64.
+# float32 (~7 significant digits) is far more than EEG amplitudes need and
+# halves memory and memory bandwidth, so with the precision set to float32
+# the helpers below keep every stage in single precision:
+#
+#   load_data(raw)             preload straight into a float32 buffer
+#   filter_raw(raw, 1., 40.)   float64 only for a few channels at a time
+#   fit_ica(ica, raw)          PCA/whitening on a temporary float64 view
+#   average(epochs)            float64 sums, float32 evoked
+#   compute_covariance(epochs) float64 accumulation
+#   apply_inverse(evoked, inv) float32 source estimate
+#
+# The setting comes from PIPELINE_PRECISION=float32 (or set_precision()); the
+# default float64 leaves MNE's behaviour unchanged. Running the module writes
+# a validation report comparing every stage of both paths:
+#
+#   python mne_precision.py [recording.set] [--fwd rec-fwd.fif]
+
+PRECISION_ENV = 'PIPELINE_PRECISION'
+
+_PRECISIONS = dict(float32=np.float32, single=np.float32, float64=np.float64,
+                   double=np.float64)
+_DTYPE = np.float64
+
+
+def set_precision(precision):
+    """Set the pipeline precision ('float32' or 'float64'); returns the dtype."""
+    global _DTYPE
+    if str(precision).lower() not in _PRECISIONS:
+        raise ValueError("Unknown precision {!r}, expected one of {}".format(
+            precision, sorted(_PRECISIONS)))
+    _DTYPE = _PRECISIONS[str(precision).lower()]
+    return _DTYPE
+
+
+def precision_from_env():
+    """Apply PIPELINE_PRECISION if set; returns the dtype in use."""
+    precision = os.environ.get(PRECISION_ENV)
+    return set_precision(precision) if precision else _DTYPE
+
+
+def get_dtype():
+    return _DTYPE
+
+
+# ------------------------------------------------------------------
+# Step 1: Loading and Casting
+# ------------------------------------------------------------------
+def _data_attr(inst):
+    # Raw/Epochs keep their samples in ``_data``; Evoked and source estimates
+    # are set through ``data``.
+    from mne import BaseEpochs
+    from mne.io import BaseRaw
+
+    return '_data' if isinstance(inst, (BaseRaw, BaseEpochs)) else 'data'
+
+
+def cast(inst, dtype=None):
+    """Cast the (loaded) data of a Raw/Epochs/Evoked/SourceEstimate in place."""
+    dtype = np.dtype(dtype or _DTYPE)
+    attr = _data_attr(inst)
+    data = getattr(inst, attr)
+    if data.dtype != dtype and not np.iscomplexobj(data):
+        setattr(inst, attr, data.astype(dtype))
+    return inst
+
+
+def load_data(raw, dtype=None):
+    """
+    Preload ``raw`` into a buffer of the pipeline precision; the reader
+    converts segment by segment, so no full float64 copy is ever made.
+    Already loaded data are cast.
+    """
+    dtype = np.dtype(dtype or _DTYPE)
+    if raw.preload:
+        return cast(raw, dtype)
+    raw._preload_data(np.empty((len(raw.ch_names), raw.n_times), dtype))
+    return raw
+
+
+@contextmanager
+def float64_data(inst):
+    """Temporarily give ``inst`` float64 data (for precision-critical reductions)."""
+    data = inst._data
+    if data.dtype == np.float64:
+        yield inst
+        return
+    inst._data = data.astype(np.float64)
+    try:
+        yield inst
+    finally:
+        inst._data = data
+
+
+# ------------------------------------------------------------------
+# Step 2: Precision-Preserving Stages
+# ------------------------------------------------------------------
+def _filter_groups(raw, picks, group_size, apply):
+    # MNE filters only float64: filter a float64 RawArray of a few channels
+    # at a time (same annotations, so skip_by_annotation still applies) and
+    # store the result back in the original dtype.
+    import mne
+
+    picks = mne.io.pick._picks_to_idx(raw.info, picks, 'data_or_ica', exclude=())
+    for g in range(0, len(picks), group_size):
+        group = picks[g:g + group_size]
+        part = mne.io.RawArray(raw._data[group].astype(np.float64),
+                               mne.pick_info(raw.info, group), first_samp=raw.first_samp,
+                               verbose=False)
+        part.set_annotations(raw.annotations)
+        apply(part)
+        raw._data[group] = part._data
+    return raw
+
+
+def filter_raw(raw, l_freq, h_freq, picks=None, group_size=8, **kwargs):
+    """raw.filter(l_freq, h_freq, picks=picks, **kwargs) that keeps the data dtype."""
+    if raw._data.dtype == np.float64:
+        return raw.filter(l_freq, h_freq, picks=picks, **kwargs)
+    from mne.filter import _filt_update_info
+
+    kwargs.setdefault('verbose', False)
+    _filter_groups(raw, picks, group_size, lambda part: part.filter(l_freq, h_freq, **kwargs))
+    _filt_update_info(raw.info, True, l_freq, h_freq)
+    return raw
+
+
+def notch_filter_raw(raw, freqs, picks=None, group_size=8, **kwargs):
+    """raw.notch_filter(freqs, picks=picks, **kwargs) that keeps the data dtype."""
+    if raw._data.dtype == np.float64:
+        return raw.notch_filter(freqs, picks=picks, **kwargs)
+    kwargs.setdefault('verbose', False)
+    return _filter_groups(raw, picks, group_size,
+                          lambda part: part.notch_filter(freqs, **kwargs))
+
+
+def fit_ica(ica, inst, **kwargs):
+    """ica.fit(inst, **kwargs) with the whitening and PCA computed in float64."""
+    with float64_data(inst):
+        return ica.fit(inst, **kwargs)
+
+
+def average(epochs, **kwargs):
+    """epochs.average(**kwargs) (float64 sums) stored in the epochs' dtype."""
+    return cast(epochs.average(**kwargs), epochs._data.dtype if epochs.preload else _DTYPE)
+
+
+def compute_covariance(epochs, **kwargs):
+    """mne.compute_covariance() accumulated in float64."""
+    import mne
+
+    epochs.load_data()
+    with float64_data(epochs):
+        return mne.compute_covariance(epochs, **kwargs)
+
+
+def apply_inverse(evoked, inverse_operator, **kwargs):
+    """apply_inverse() returning a source estimate in the evoked's dtype."""
+    from mne.minimum_norm import apply_inverse as _apply_inverse
+
+    out = _apply_inverse(evoked, inverse_operator, **kwargs)
+    stc = out[0] if isinstance(out, tuple) else out
+    cast(stc, evoked.data.dtype)
+    return out
+
+
+# ------------------------------------------------------------------
+# Step 3: Validation Report (float32 vs float64)
+# ------------------------------------------------------------------
+def _sphere_forward(info):
+    # Spherical head + volume grid: enough to exercise the inverse stage.
+    import mne
+
+    sphere = mne.make_sphere_model('auto', 'auto', info, verbose=False)
+    src = mne.setup_volume_source_space(sphere=sphere, pos=20., verbose=False)
+    return mne.make_forward_solution(info, trans=None, src=src, bem=sphere, eeg=True,
+                                     meg=False, verbose=False)
+
+
+def run_stages(make_raw, dtype, l_freq=1., h_freq=40., n_components=15, tmin=-0.2,
+               tmax=0.8, fwd=None, ica=None):
+    """
+    Run load -> filter -> ICA -> epochs -> average -> covariance -> dSPM in
+    ``dtype``. Returns ``stages, extras``: {stage: (array, seconds)} and a
+    dict with the ICA used ('ica'), its exclusion list ('exclude') and, when
+    a fitted ``ica`` is given (applied instead of fitting, so that later
+    stages differ only by precision), the ICA fitted in ``dtype`` ('own_ica').
+    """
+    import mne
+    from mne.minimum_norm import make_inverse_operator
+    from mne.preprocessing import ICA
+    from mne_ica_scoring import find_artifact_components
+
+    stages, extras, t0 = dict(), dict(), time.perf_counter()
+
+    def record(stage, data):
+        nonlocal t0
+        stages[stage] = (np.array(data, copy=True), time.perf_counter() - t0)
+        t0 = time.perf_counter()
+
+    raw = load_data(make_raw(), dtype)
+    record('load', raw._data)
+    filter_raw(raw, l_freq, h_freq, fir_design='firwin')
+    record('filter', raw._data)
+    own = fit_ica(ICA(n_components=n_components, random_state=97, max_iter='auto'), raw)
+    if ica is None:
+        ica = own
+    else:
+        extras['own_ica'] = own
+    t0 = time.perf_counter()
+    exclude, _ = find_artifact_components(ica, raw)
+    ica.apply(raw, exclude=exclude)
+    record('ica', raw._data)
+    extras.update(ica=ica, exclude=exclude)
+    events, event_id = mne.events_from_annotations(raw, verbose=False)
+    epochs = mne.Epochs(raw, events, event_id, tmin=tmin, tmax=tmax, baseline=(None, 0),
+                        preload=True, verbose=False)
+    record('epochs', epochs._data)
+    evoked = average(epochs)
+    record('evoked', evoked.data)
+    if fwd is None:
+        return stages, extras
+    if not any(p['desc'] == 'Average EEG reference' for p in evoked.info['projs']):
+        evoked.set_eeg_reference('average', projection=True, verbose=False)
+        epochs.set_eeg_reference('average', projection=True, verbose=False)
+    noise_cov = compute_covariance(epochs, tmax=0., method='empirical', verbose=False)
+    record('covariance', noise_cov.data)
+    inv = make_inverse_operator(evoked.info, fwd, noise_cov, loose='auto', depth=0.8,
+                                verbose=False)
+    stc = apply_inverse(evoked, inv, lambda2=1. / 9., method='dSPM', verbose=False)
+    record('dspm', stc.data)
+    return stages, extras
+
+
+def compare(reference, test):
+    """Per-stage deviation of ``test`` from ``reference`` (stages of run_stages)."""
+    rows = []
+    for stage in reference:
+        if stage not in test:
+            continue
+        (ref, t_ref), (data, t_test) = reference[stage], test[stage]
+        if data.shape != ref.shape:
+            rows.append(dict(stage=stage, shape=ref.shape, error='shape {}'.format(data.shape)))
+            continue
+        diff = np.abs(data.astype(np.float64) - ref)
+        scale = np.abs(ref).max() or 1.
+        rows.append(dict(
+            stage=stage, shape=ref.shape, max_abs=diff.max(), max_rel=diff.max() / scale,
+            rms_rel=np.sqrt(np.mean(diff ** 2) / np.mean(ref ** 2)) if ref.any() else 0.,
+            mb_ref=ref.nbytes / 1e6, mb_test=data.nbytes / 1e6, s_ref=t_ref, s_test=t_test))
+    return rows
+
+
+def pattern_agreement(ica_ref, ica_test):
+    """For every component of ``ica_ref``, the best |cosine| with a pattern of ``ica_test``."""
+    a, b = ica_ref.get_components(), ica_test.get_components()
+    a = a / np.linalg.norm(a, axis=0)
+    b = b / np.linalg.norm(b, axis=0)
+    return np.abs(a.T @ b).max(axis=1)
+
+
+def format_report(rows, reference=None, test=None):
+    lines = ['{:<11} {:>18} {:>10} {:>10} {:>10} {:>15} {:>13}'.format(
+        'stage', 'shape', 'max |err|', 'max rel', 'rms rel', 'MB f64 -> f32', 's f64 / f32')]
+    for row in rows:
+        if 'error' in row:
+            lines.append('{:<11} {:>18} {}'.format(row['stage'], str(row['shape']), row['error']))
+            continue
+        lines.append('{:<11} {:>18} {:>10.2e} {:>10.2e} {:>10.2e} {:>7.1f} -> {:<6.1f} '
+                     '{:>5.2f} / {:<5.2f}'.format(
+                         row['stage'], str(row['shape']), row['max_abs'], row['max_rel'],
+                         row['rms_rel'], row['mb_ref'], row['mb_test'], row['s_ref'],
+                         row['s_test']))
+    lines.append('max rel = max |f32 - f64| / max |f64|; rms rel = RMS error / RMS of f64')
+    if reference is not None:
+        lines.append('ICA exclusion (float64 decomposition): float64 {} / float32 {} ({})'.format(
+            reference['exclude'], test['exclude'],
+            'identical' if list(reference['exclude']) == list(test['exclude'])
+            else 'DIFFERENT'))
+        if 'own_ica' in test:
+            ica_ref, own = reference['ica'], test['own_ica']
+            match = pattern_agreement(ica_ref, own)
+            lines.append('ICA refit in float32: component patterns match with |cos| min {:.4f}, '
+                         'median {:.4f}; iterations {} (float64) / {} (float32) of {}'.format(
+                             match.min(), np.median(match), ica_ref.n_iter_, own.n_iter_,
+                             ica_ref.max_iter))
+            if max(ica_ref.n_iter_, own.n_iter_) >= ica_ref.max_iter:
+                lines.append('  (FastICA did not converge: unconverged components are not '
+                             'reproducible at any precision)')
+    return '\n'.join(lines)
+
+
+def validation_report(make_raw, fwd=None, **kwargs):
+    """
+    Run both precisions on the recording returned by ``make_raw()``; the
+    float32 run applies the float64 ICA decomposition (its own float32 fit is
+    compared separately). Returns the report.
+    """
+    reference, ref_extras = run_stages(make_raw, np.float64, fwd=fwd, **kwargs)
+    test, test_extras = run_stages(make_raw, np.float32, fwd=fwd, ica=ref_extras['ica'],
+                                   **kwargs)
+    return format_report(compare(reference, test), ref_extras, test_extras)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare float32 and float64 pipelines.')
+    parser.add_argument('input', nargs='?',
+                        help='recording (default: a synthetic 64-channel recording)')
+    parser.add_argument('--fwd', help='forward solution (-fwd.fif); default: sphere model')
+    parser.add_argument('--no-inverse', action='store_true', help='skip covariance and dSPM')
+    parser.add_argument('--n-components', type=int, default=15)
+    parser.add_argument('-o', '--output', help='also write the report to this file')
+    args = parser.parse_args(argv)
+    import mne
+
+    mne.set_log_level('WARNING')
+    if args.input:
+        def make_raw():
+            raw = mne.io.read_raw(args.input, preload=False)
+            raw.set_montage('standard_1020', on_missing='ignore')
+            return raw
+    else:
+        from mne_synthetic_data import make_synthetic_raw
+
+        def make_raw():
+            return make_synthetic_raw(n_channels=64, duration=300., sfreq=250., eog=True)
+    fwd = None
+    if not args.no_inverse:
+        fwd = mne.read_forward_solution(args.fwd) if args.fwd else \
+            _sphere_forward(make_raw().pick('eeg').info)
+    report = validation_report(make_raw, fwd=fwd, n_components=args.n_components)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as fid:
+            fid.write(report + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,20 @@
 import os
 import mne
-from mne.preprocessing import ICA, create_eog_epochs
+from mne.preprocessing import ICA
 import matplotlib.pyplot as plt
+from mne_annotation_index import load_or_build_index
+from mne_epoch_rejection import epochs_with_rejection
+from mne_ica_scoring import find_artifact_components
+from mne_instrumentation import configure_from_env, disable, span, summary
+from mne_precision import filter_raw, fit_ica, load_data, precision_from_env
+from mne_resample import plan_sfreq, resample_raw
+
+# Per-stage timing/memory trace: run with PIPELINE_TRACE=trace.json (Chrome
+# trace) or PIPELINE_TRACE=trace.jsonl; PIPELINE_PROFILE=1 adds a profile.
+tracer = configure_from_env()
+# PIPELINE_PRECISION=float32 keeps data, filter output and epochs in single
+# precision (ICA whitening still runs in float64).
+precision_from_env()
 
 # ------------------------------------------------------------------
 # Step 1: Load the EEG Data (EEGLAB .set file)
@@ -9,7 +22,8 @@ import matplotlib.pyplot as plt
 
 set_file_path = 's17_1.set'
 
-raw = mne.io.read_raw_eeglab(set_file_path, preload=True)
+with span('load', fname=set_file_path):
+    raw = load_data(mne.io.read_raw_eeglab(set_file_path, preload=False))
 print("Raw Data Loaded:")
 print(raw)
 
@@ -22,14 +36,28 @@ raw.plot(n_channels=64, title='Raw Data: Before Preprocessing', show=True)
 # Setting a standard montage assigns typical electrode positions.
 # "standard_1020" is commonly used for EEG data.
 montage = mne.channels.make_standard_montage('standard_1020')
-raw.set_montage(montage, on_missing='warn')
+with span('montage'):
+    raw.set_montage(montage, on_missing='warn')
 print("Montage set to standard_1020.")
 
 # ------------------------------------------------------------------
 # Step 3: Filtering (Bandpass 1-40 Hz)
 # ------------------------------------------------------------------
 # Bandpass filtering between 1 and 40 Hz removes slow drifts and high-frequency noise.
-raw_filtered = raw.copy().filter(l_freq=1, h_freq=40, fir_design='firwin')
+# The later stages declare the highest frequency they use; with nothing needed
+# above the 40 Hz low-pass, the data are resampled to the lowest adequate rate
+# in the same pass as the bandpass (e.g. 500 -> 100 Hz), which makes ICA,
+# epoching and saving proportionally cheaper.
+stage_bandwidth = dict(ica=40., artifact_scoring=10., epochs=40., save=40.)
+target_sfreq = plan_sfreq(raw.info['sfreq'], stage_bandwidth.values(), h_freq=40.)
+with span('filter', l_freq=1, h_freq=40, sfreq=target_sfreq):
+    if target_sfreq is None:
+        raw_filtered = filter_raw(raw.copy(), l_freq=1, h_freq=40, fir_design='firwin')
+    else:
+        raw_filtered = resample_raw(raw, target_sfreq, l_freq=1, h_freq=40,
+                                    fir_design='firwin')
+        print("Resampled from {:g} Hz to {:g} Hz.".format(raw.info['sfreq'],
+                                                          raw_filtered.info['sfreq']))
 print("Bandpass filtering applied (1-40 Hz).")
 raw_filtered.plot(n_channels=64, title='Filtered Data (1-40 Hz)', show=True)
 
@@ -63,25 +91,22 @@ raw_filtered.plot(n_channels=64, title='After Marking Bad Channels', bad_color='
 # - random_state=97: For reproducibility.
 # - max_iter='auto': Let MNE decide the number of iterations.
 ica = ICA(n_components=20, random_state=97, max_iter='auto')
-ica.fit(raw_filtered)
+with span('ica_fit', n_components=20):
+    fit_ica(ica, raw_filtered)
 print("ICA fitted on filtered data.")
 
-# Optionally, use an EOG channel to help identify eye blink artifacts:
-if 'EOG' in raw_filtered.ch_names:
-    eog_epochs = create_eog_epochs(raw_filtered, ch_name='EOG')
-    eog_inds, scores = ica.find_bads_eog(eog_epochs)
-    print("Detected EOG-related ICA components:", eog_inds)
-    ica.exclude = eog_inds
-else:
-    # If no EOG channel is available, inspect components visually.
-    # Here, for demonstration, we assume components 0 and 3 are artifacts.
-    ica.exclude = [0, 3]
-    print("Manually marked components [0, 3] as artifacts.")
+# Score every component against the EOG channel (or, without one, frontal
+# proxy channels) on the continuous data and exclude the outliers.
+with span('ica_artifact_scoring', n_components=ica.n_components_):
+    artifact_inds, artifact_scores = find_artifact_components(ica, raw_filtered)
+ica.exclude = artifact_inds
+print("Detected artifact-related ICA components:", ica.exclude)
 
 
 # Apply ICA to remove artifact components and reconstruct the clean signal.
-raw_clean = raw_filtered.copy()
-ica.apply(raw_clean)
+with span('ica_apply', n_excluded=len(ica.exclude)):
+    raw_clean = raw_filtered.copy()
+    ica.apply(raw_clean)
 print("ICA applied; artifacts removed.")
 raw_clean.plot(n_channels=64, title="Cleaned Data after ICA", show=True)
 
@@ -90,7 +115,13 @@ raw_clean.plot(n_channels=64, title="Cleaned Data after ICA", show=True)
 # Step 6: Epoching (Optional)
 # ------------------------------------------------------------------
 # Convert annotations to events. This will create an event array from annotations.
-events, event_id = mne.events_from_annotations(raw_clean)
+# The annotation index (cached beside the data file as s17_1-annot-<sfreq>Hz.npz,
+# one per rate, so the resampled data here and the native-rate scripts do not
+# overwrite each other's cache) builds the events from interned description
+# codes instead of re-parsing the strings.
+with span('events'):
+    index = load_or_build_index(raw_clean, set_file_path)
+    events, event_id = index.to_events()
 print("Event IDs from annotations:", event_id)
 print("Total events detected:", len(events))
 
@@ -101,8 +132,13 @@ if "Encoding" in event_id:
     tmin = -0.2  # 200 ms before the event
     tmax = 0.8   # 800 ms after the event
     baseline = (None, 0)  # Baseline correction using pre-stimulus period
-    epochs = mne.Epochs(raw_clean, events, event_id=event_id, tmin=tmin, tmax=tmax,
-                        baseline=baseline, preload=True)
+    reject = dict(eeg=150e-6)  # Drop epochs with EEG peak-to-peak above 150 µV
+    with span('epoch', n_events=len(events)) as sp:
+        # Rejected epochs are found on the continuous data and never extracted.
+        epochs = epochs_with_rejection(raw_clean, events, event_id=event_id, tmin=tmin,
+                                       tmax=tmax, reject=reject, baseline=baseline,
+                                       preload=True)
+        sp.set(n_epochs=len(epochs))
     epochs_encoding = epochs["Encoding"]
     print("Epochs for 'Encoding' condition:")
     print(epochs_encoding)
@@ -116,7 +152,13 @@ else:
 # ------------------------------------------------------------------
 # Save the cleaned data for later use.
 preprocessed_file = r'C:\Users\harsh\Downloads\data\s17_1_preprocessed.fif'
-raw_clean.save(preprocessed_file, overwrite=True)
+with span('save', fname=preprocessed_file):
+    raw_clean.save(preprocessed_file, overwrite=True)
 print("Preprocessed data saved at:", preprocessed_file)
 
+if tracer is not None:
+    disable()
+    print(summary(tracer.records))
+    print("Stage trace written to", tracer.output)
+
 input("press ctrl+c to exit")
\ No newline at end of file
@@ -8,6 +8,14 @@ print("Dataset Info: ",raw)
 
 raw.plot(n_channels=63, title='Raw Data: Before Filtering')
 
+# Full-length overview drawn from the min/max pyramid (built once and cached
+# next to the .set file), so it stays fast for multi-hour recordings.
+import matplotlib.pyplot as plt
+from mne_minmax_pyramid import browse, load_or_build_pyramid
+pyramid = load_or_build_pyramid(raw, set_file_path)
+browse(raw, pyramid, picks=range(min(32, len(raw.ch_names))))
+plt.show()
+
 
 # Optional: Use input() to keep the script running (especially in some environments)
 input("Press Enter to exit...")
\ No newline at end of file
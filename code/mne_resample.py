@@ -0,0 +1,294 @@
+from fractions import Fraction
+from math import gcd
+
+import numpy as np
+from mne.io import BaseRaw
+
+# ------------------------------------------------------------------
+# Chunked polyphase resampling, fused with the band-pass filter
+# ------------------------------------------------------------------
+# After a 1-40 Hz band-pass most of the native sampling rate is redundant.
+# resample_raw() band-pass filters and resamples by a rational factor
+# up/down in one pass: the band-pass FIR is designed at sfreq * up (the
+# same transition bands and length in seconds as raw.filter()) and only
+# evaluated at the output samples: polyphase (scipy.signal.resample_poly)
+# for short kernels, an FFT convolution of the zero-stuffed signal for long
+# ones (the high-pass edge). The recording is processed in chunks with
+# enough context on both sides that every chunk equals the corresponding
+# part of the whole-signal result:
+#
+#   raw_100 = resample_raw(raw, 100., l_freq=1., h_freq=40.)   # 500 -> 100 Hz
+#
+# Channel handling: data channels (as raw.filter()) get the band-pass,
+# other continuous channels (EOG, ECG, ...) only the anti-aliasing
+# low-pass, stim channels take the nearest sample with every transition
+# kept. As raw.filter(), the data are filtered separately between
+# skip_by_annotation boundaries ('edge' annotations of concatenated runs,
+# 'bad_acq_skip'). Annotations are time based and carried over; event arrays
+# are mapped with resample_events(). plan_sfreq() picks the target rate from the
+# bandwidth the downstream stages declare.
+
+
+# ------------------------------------------------------------------
+# Step 1: Rate Planning and Filter Design
+# ------------------------------------------------------------------
+def auto_trans_bandwidth(l_freq, h_freq, sfreq):
+    """Transition bandwidths MNE uses for l_trans/h_trans_bandwidth='auto'."""
+    l_trans = None if l_freq is None else min(max(0.25 * l_freq, 2.), l_freq)
+    h_trans = None if h_freq is None else min(max(0.25 * h_freq, 2.), sfreq / 2. - h_freq)
+    return l_trans, h_trans
+
+
+def resample_ratio(sfreq, new_sfreq, max_denominator=1000):
+    """Return ``up, down`` with new_sfreq == sfreq * up / down (closest rational)."""
+    ratio = Fraction(float(new_sfreq) / float(sfreq)).limit_denominator(max_denominator)
+    return ratio.numerator, ratio.denominator
+
+
+def choose_sfreq(sfreq, min_sfreq, max_factor=10):
+    """
+    Lowest rate sfreq * up / down (down <= ``max_factor``) of at least
+    ``min_sfreq``, preferring integer rates; ``sfreq`` if none is lower.
+    """
+    best = None
+    for down in range(2, max_factor + 1):
+        for up in range(1, down):
+            if gcd(up, down) != 1:
+                continue
+            target = sfreq * up / down
+            if target < min_sfreq:
+                continue
+            key = (not float(target).is_integer(), target, down)
+            if best is None or key < best[0]:
+                best = (key, target)
+    return sfreq if best is None else best[1]
+
+
+def plan_sfreq(sfreq, bandwidths, h_freq=None):
+    """
+    Sampling rate for the stages declaring ``bandwidths`` (highest
+    frequency in Hz each one needs; None: needs the native rate). With a
+    low-pass at ``h_freq``, its stop band must also stay below Nyquist.
+    Returns None when resampling would not reduce the rate.
+    """
+    bandwidths = list(bandwidths)
+    if not bandwidths or any(bw is None for bw in bandwidths):
+        return None
+    need = max(bandwidths)
+    if h_freq is not None:
+        need = max(need, h_freq + auto_trans_bandwidth(None, h_freq, sfreq)[1])
+    else:
+        need = 1.25 * need  # anti-aliasing low-pass at need, 25% transition
+    target = choose_sfreq(sfreq, 2. * need)
+    return None if target >= sfreq else target
+
+
+def design_filter(sfreq, up, l_freq, h_freq, l_trans_bandwidth='auto',
+                  h_trans_bandwidth='auto', fir_window='hamming', fir_design='firwin'):
+    """
+    Linear-phase FIR at ``sfreq * up`` equivalent to raw.filter(l_freq,
+    h_freq) at ``sfreq`` (transition bands resolved at the original rate).
+    """
+    import mne
+
+    l_auto, h_auto = auto_trans_bandwidth(l_freq, h_freq, sfreq)
+    if l_trans_bandwidth == 'auto':
+        l_trans_bandwidth = l_auto
+    if h_trans_bandwidth == 'auto':
+        h_trans_bandwidth = h_auto
+    return mne.filter.create_filter(
+        None, sfreq * up, l_freq, h_freq, l_trans_bandwidth=l_trans_bandwidth or 'auto',
+        h_trans_bandwidth=h_trans_bandwidth or 'auto', fir_window=fir_window,
+        fir_design=fir_design, phase='zero', verbose=False)
+
+
+def resample_events(events, sfreq, new_sfreq, first_samp=0, new_first_samp=None):
+    """
+    Map event samples to ``new_sfreq`` (nearest output sample). Event times
+    relative to the first sample are kept to within half an output sample.
+    """
+    up, down = resample_ratio(sfreq, new_sfreq)
+    if new_first_samp is None:
+        new_first_samp = int(round(first_samp * up / down))
+    events = np.array(events, copy=True)
+    events[:, 0] = new_first_samp + np.round((events[:, 0] - first_samp) * up / down).astype(int)
+    return events
+
+
+# ------------------------------------------------------------------
+# Step 2: Chunked Resampling
+# ------------------------------------------------------------------
+def fir_resample(x, h, up, down, j0, n):
+    """
+    Output samples j0 .. j0 + n - 1 of ``x`` (rows) upsampled by ``up``,
+    filtered with the linear-phase FIR ``h`` (designed at the upsampled
+    rate) and downsampled by ``down``; output j lies at input time
+    j * down / up. Short kernels run polyphase (resample_poly), long ones
+    (high-pass edges) as an FFT convolution of the zero-stuffed signal.
+    """
+    from scipy.signal import oaconvolve, resample_poly
+
+    if len(h) <= 64 * up:
+        y = resample_poly(x, up, down, axis=1, window=h, padtype='constant')
+        return y[:, j0:j0 + n]
+    if up > 1:
+        stuffed = np.zeros((len(x), x.shape[1] * up))
+        stuffed[:, ::up] = x
+    else:
+        stuffed = x
+    # Only the span of the full convolution that holds the wanted samples.
+    half = len(h) // 2
+    t = np.arange(j0, j0 + n) * down + half
+    lo, hi = max(t[0] - len(h) + 1, 0), t[-1] + 1
+    z = oaconvolve(stuffed[:, lo:hi], h[None] * up, mode='full', axes=1)
+    return z[:, t - lo]
+
+
+def _resample_segment(extras, a, b, j0, j1, out):
+    """
+    Output samples [j0, j1) of the filtered rows, computed from input
+    samples [a, b) only (one segment between skip_by_annotation boundaries).
+    """
+    source, up, down = extras['source'], extras['up'], extras['down']
+    # Input context covering the longest filter; the segment starts on a
+    # multiple of ``down`` so its output grid lines up with the global one.
+    context = -(-(extras['half_len'] // up + 1) // down) * down
+    s = max(a, (j0 * down // up - context) // down * down)
+    e = min(b, -(-j1 * down // up) + context)
+    seg = source.get_data(start=s, stop=e)
+    # At the segment ends, pad by odd reflection (as raw.filter()); on the
+    # left up to the next multiple of ``down`` below the context.
+    left = context + (s - context) % down if s == a else 0
+    right = context if e == b else 0
+    padded = np.pad(seg, ((0, 0), (left, right)), mode='reflect', reflect_type='odd') \
+        if left or right else seg
+    off = (s - left) * up // down
+    for rows, h in extras['groups']:
+        out[rows] = fir_resample(padded[rows], h, up, down, j0 - off, j1 - j0)
+
+
+def _resample_block(extras, k0, k1):
+    """Output samples [k0, k1) of all channels (float64)."""
+    source, up, down = extras['source'], extras['up'], extras['down']
+    n_in = source.n_times
+    out = np.empty((len(source.ch_names), k1 - k0))
+    # Output j (at input time j * down / up) belongs to the segment holding
+    # the input sample at or before it.
+    for a, b in extras['segments']:
+        j0, j1 = max(k0, -(-a * up // down)), min(k1, -(-b * up // down))
+        if j0 < j1:
+            _resample_segment(extras, a, b, j0, j1, out[:, j0 - k0:j1 - k0])
+    stim = extras['stim']
+    if len(stim):
+        s = min(k0 * down // up, n_in - 1)
+        e = min(n_in, -(-k1 * down // up) + 1)
+        seg = source.get_data(picks=stim, start=s, stop=e)
+        nearest = np.minimum(np.floor(np.arange(k0, k1) * down / up + 0.5).astype(int),
+                             n_in - 1) - s
+        out[stim] = seg[:, nearest]
+        # Keep every onset of a new (non-zero) value, even between samples.
+        for i, row in enumerate(stim):
+            x = seg[i]
+            onsets = np.flatnonzero((x[1:] != x[:-1]) & (x[1:] != 0)) + 1
+            k = np.round((onsets + s) * up / down).astype(int)
+            inside = (k >= k0) & (k < k1)
+            out[row, k[inside] - k0] = x[onsets[inside]]
+    return out
+
+
+class RawResampled(BaseRaw):
+    """
+    Lazily band-passed and resampled view of another Raw; see
+    resample_raw(). Samples are computed chunk by chunk when read.
+    """
+
+    def __init__(self, source, sfreq, l_freq=None, h_freq=None, picks=None,
+                 skip_by_annotation=('edge', 'bad_acq_skip'), chunk_duration=30.,
+                 verbose=None, **filter_kwargs):
+        import mne
+        from mne.annotations import _annotations_starts_stops
+
+        old_sfreq = source.info['sfreq']
+        up, down = resample_ratio(old_sfreq, sfreq)
+        sfreq = old_sfreq * up / down
+        nyq = sfreq / 2.
+        aa_freq = nyq / 1.25  # anti-aliasing low-pass: 25% transition up to Nyquist
+        if h_freq is None:
+            h_freq = aa_freq
+        h_trans = filter_kwargs.get('h_trans_bandwidth', 'auto')
+        if h_trans == 'auto':
+            h_trans = auto_trans_bandwidth(None, h_freq, old_sfreq)[1]
+        if h_freq + h_trans > nyq + 1e-9:
+            raise ValueError("Low-pass {} Hz (+{} Hz transition) is above the Nyquist "
+                             "frequency of {} Hz; use a higher sfreq".format(h_freq, h_trans,
+                                                                              nyq))
+        picks = mne.io.pick._picks_to_idx(source.info, picks, 'data_or_ica', exclude=())
+        stim = mne.pick_types(source.info, meg=False, stim=True, exclude=())
+        other = np.setdiff1d(np.arange(len(source.ch_names)), np.union1d(picks, stim))
+        groups = [(picks, design_filter(old_sfreq, up, l_freq, h_freq, **filter_kwargs))]
+        if len(other):
+            groups.append((other, design_filter(old_sfreq, up, None, aa_freq)))
+        # Segments between the onsets/ends of skip_by_annotation annotations.
+        onsets, ends = _annotations_starts_stops(source, skip_by_annotation)
+        bounds = np.unique(np.r_[0, onsets, ends, source.n_times].clip(0, source.n_times))
+        extras = dict(source=source, up=up, down=down, groups=groups, stim=stim,
+                      segments=list(zip(bounds[:-1], bounds[1:])),
+                      half_len=max(len(h) // 2 for _, h in groups),
+                      chunk=max(1, int(chunk_duration * sfreq)))
+
+        info = source.info.copy()
+        with info._unlock():
+            info['sfreq'] = sfreq
+            info['lowpass'] = min(h_freq, nyq) if info['lowpass'] is None \
+                else min(info['lowpass'], h_freq, nyq)
+            if l_freq is not None:
+                info['highpass'] = max(l_freq, info['highpass'] or 0.)
+            for ch in info['chs']:  # samples are computed in SI units
+                ch['cal'], ch['range'] = 1., 1.
+        n_out = -(-source.n_times * up // down)
+        first = extras['first_samp'] = int(round(source.first_samp * up / down))
+        super().__init__(info, preload=False, first_samps=[first],
+                         last_samps=[first + n_out - 1], raw_extras=[extras],
+                         orig_format='double', verbose=verbose)
+        annotations = source.annotations.copy()
+        if annotations.orig_time is None:
+            # Without a meas_date, set_annotations() counts onsets from the
+            # first sample; raw.annotations reports them from sample 0.
+            annotations.onset -= self.first_time
+        self.set_annotations(annotations)
+
+    def _read_segment_file(self, data, idx, fi, start, stop, cals, mult):
+        from mne._fiff.utils import _mult_cal_one
+
+        extras = self._raw_extras[fi]
+        # start/stop count from the first sample of the acquisition.
+        start, stop = start - extras['first_samp'], stop - extras['first_samp']
+        for k0 in range(start, stop, extras['chunk']):
+            k1 = min(k0 + extras['chunk'], stop)
+            _mult_cal_one(data[:, k0 - start:k1 - start], _resample_block(extras, k0, k1),
+                          idx, cals, mult)
+
+    def _preload_data(self, preload):
+        super()._preload_data(preload)
+        self._raw_extras[0]['source'] = None  # release the original recording
+
+
+def resample_raw(raw, sfreq, l_freq=None, h_freq=None, picks=None, preload=True,
+                 skip_by_annotation=('edge', 'bad_acq_skip'), chunk_duration=30.,
+                 verbose=None, **filter_kwargs):
+    """
+    Band-pass (l_freq, h_freq; as raw.filter(), also between
+    ``skip_by_annotation`` boundaries) and resample ``raw`` to ``sfreq`` in
+    one chunked pass. Returns a new Raw, preloaded in the
+    dtype of the input data (or the pipeline precision) unless
+    ``preload=False``. ``filter_kwargs`` go to the FIR design
+    (l/h_trans_bandwidth, fir_window, fir_design).
+    """
+    from mne_precision import get_dtype, load_data
+
+    out = RawResampled(raw, sfreq, l_freq=l_freq, h_freq=h_freq, picks=picks,
+                       skip_by_annotation=skip_by_annotation,
+                       chunk_duration=chunk_duration, verbose=verbose, **filter_kwargs)
+    if preload:
+        load_data(out, raw._data.dtype if raw.preload else get_dtype())
+    return out
@@ -1,22 +1,26 @@
 from mne.datasets import eegbci
 import os
-from mne.io import read_raw_edf
+from mne_edf_runs import read_edf_runs
 
-# Download EEGBCI data for subject 1 and motor imagery runs (e.g., runs 4, 8, 12)
-eeg_data_paths = eegbci.load_data(subject=1, runs=[4, 8, 12])
+# Download EEGBCI data for subjects 1-2 and motor imagery runs (e.g., runs 4, 8, 12)
+subjects = [1, 2]
+eeg_data_paths = []
+for subject in subjects:
+    eeg_data_paths += eegbci.load_data(subject=subject, runs=[4, 8, 12])
 print("Downloaded EEGBCI file paths:")
 for path in eeg_data_paths:
     print("  ", path)
 
 
-# Select one of the downloaded files for demonstration
-raw_file = eeg_data_paths[0]
-print("Reading EEG file:", os.path.basename(raw_file))
-
-# Read the EEG data (preload=True loads the data into memory for faster processing)
-raw = read_raw_edf(raw_file, preload=True)
+# Read all runs as one continuous recording: headers are parsed in parallel and
+# checked for matching channels/sfreq; data are decoded only when requested.
+# Run boundaries are marked with 'BAD boundary' / 'EDGE boundary' annotations.
+raw = read_edf_runs(eeg_data_paths)
 print("Raw EEG data info:")
 print(raw)
+for run in raw.runs:
+    print("  {}: samples {} - {}".format(os.path.basename(run['fname']), run['start'],
+                                         run['start'] + run['n_times']))
 
 print("\nDataset Inforrmation",raw.info)
 
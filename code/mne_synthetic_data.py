@@ -0,0 +1,420 @@
+import os
+import numpy as np
+from scipy import signal
+from mne.io import BaseRaw
+
+# ------------------------------------------------------------------
+# Synthetic EEG recordings for load testing
+# ------------------------------------------------------------------
+# Generates recordings that look like s17_1.set without needing the file or a
+# download: 1/f background, posterior alpha bursts, blinks on frontal
+# channels, 50 Hz line noise, a few bad channels and an Encoding/Recall
+# annotation stream with an ERP after each Encoding event. Any channel count
+# (32 ... 512) and duration (minutes ... many hours) works.
+#
+# Data are produced block by block from a seeded generator, so nothing ever
+# holds the whole recording:
+#   - write_synthetic_eeglab() streams the samples into a .set/.fdt pair,
+#   - make_synthetic_raw() returns a lazy Raw (preload=False) that
+#     raw.save('..._raw.fif') writes chunk by chunk.
+# The same seed always gives the same data, whatever the read sizes.
+
+# Pinking filter (Kellet/RBJ 3-pole approximation of a 1/f spectrum).
+_PINK_B = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+_PINK_A = np.array([1., -2.494956002, 2.017265875, -0.522189400])
+# Approximate centre of the standard montage sphere (head coordinates, m).
+_HEAD_CENTER = np.array([0., -0.015, 0.])
+
+
+# ------------------------------------------------------------------
+# Step 1: Channel Layout
+# ------------------------------------------------------------------
+def make_layout(n_channels):
+    """
+    Pick ``n_channels`` electrode names and positions (head coordinates, m).
+    Small counts come from the 10-20 montage and larger ones from the 10-05
+    montage, spread out by farthest-point sampling starting at Fp1/Fp2;
+    channels beyond the 10-05 sites (EEG<k>) are spread over the upper half
+    of the head sphere.
+    """
+    import mne
+
+    for kind in ('standard_1020', 'standard_1005'):
+        ch_pos = mne.channels.make_standard_montage(kind).get_positions()['ch_pos']
+        # Skip sites below the eye line (ears, mastoids, inion row) and
+        # aliases of the same site (T3/T7, ...).
+        names = [name for name, p in ch_pos.items() if p[2] > -0.01]
+        _, first = np.unique(np.round([ch_pos[name] for name in names], 6), axis=0,
+                             return_index=True)
+        names = [names[k] for k in np.sort(first)]
+        if n_channels <= len(names):
+            break
+    pos = np.array([ch_pos[name] for name in names])
+
+    chosen = [names.index('Fp1'), names.index('Fp2')][:n_channels]
+    dist = np.min([np.linalg.norm(pos - pos[k], axis=1) for k in chosen], axis=0)
+    dist[chosen] = -1
+    while len(chosen) < min(n_channels, len(names)):
+        k = int(np.argmax(dist))
+        chosen.append(k)
+        dist = np.minimum(dist, np.linalg.norm(pos - pos[k], axis=1))
+        dist[chosen] = -1
+    ch_names = [names[k] for k in chosen]
+    positions = [pos[k] for k in chosen]
+
+    n_extra = n_channels - len(ch_names)
+    if n_extra > 0:
+        k = np.arange(n_extra) + 0.5
+        z = 1 - k / n_extra
+        r = np.sqrt(1 - z ** 2)
+        phi = np.pi * (1 + 5 ** 0.5) * k
+        extra = _HEAD_CENTER + 0.095 * np.c_[r * np.cos(phi), r * np.sin(phi), z]
+        ch_names += ['EEG{:03d}'.format(len(names) + i + 1) for i in range(n_extra)]
+        positions += list(extra)
+    return ch_names, np.array(positions)
+
+
+def _spatial_weights(positions, target, width):
+    # Smooth topography centred on the direction of a 10-05 electrode.
+    import mne
+
+    ch_pos = mne.channels.make_standard_montage('standard_1005').get_positions()['ch_pos']
+    dirs = positions - _HEAD_CENTER
+    dirs /= np.linalg.norm(dirs, axis=1, keepdims=True)
+    center = ch_pos[target] - _HEAD_CENTER
+    center /= np.linalg.norm(center)
+    return np.exp((dirs @ center - 1) / width)
+
+
+# ------------------------------------------------------------------
+# Step 2: Recording Description (events, bursts, bad channels)
+# ------------------------------------------------------------------
+def make_recording(n_channels=64, duration=600., sfreq=500., n_events=None,
+                   n_bad=None, line_freq=50., eog=False, seed=0):
+    """
+    Describe a synthetic recording: layout, annotations and the timing of
+    every transient (alpha bursts, blinks, ERPs). The description is small
+    (it never contains samples) and fully determines the generated data.
+
+    ``n_events`` is the number of Encoding/Recall annotations (default: one
+    Encoding/Recall pair every ~3 s). ``n_bad`` channels (default n/32) are
+    made noisy or flat; their names are in ``bad_channels``. With
+    ``eog=True`` an 'EOG' channel carrying the blinks is appended.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(4)
+    rng = np.random.default_rng(seeds[0])
+    ch_names, positions = make_layout(n_channels)
+    n_times = int(round(duration * sfreq))
+
+    # Encoding/Recall stream: Recall 1-2 s after each Encoding.
+    if n_events is None:
+        n_trials = max(1, int((duration - 4.) / 3.))
+    else:
+        n_trials = max(1, -(-n_events // 2))
+    enc = np.linspace(2., max(duration - 4., 2.), n_trials) + rng.uniform(-0.3, 0.3, n_trials)
+    rec = enc + rng.uniform(1., 2., n_trials)
+    onsets = np.c_[enc, rec].ravel()
+    descriptions = np.tile(['Encoding', 'Recall'], n_trials)
+    if n_events is not None:
+        onsets, descriptions = onsets[:n_events], descriptions[:n_events]
+    # On the sample grid and at least one sample apart: with dense n_events
+    # the jittered onsets collide, and mne.Epochs refuses duplicate events.
+    order = np.argsort(onsets, kind='stable')
+    samples, descriptions = np.round(onsets[order] * sfreq).astype(np.int64), descriptions[order]
+    step = np.arange(len(samples))
+    samples = np.maximum.accumulate(samples - step) + step
+    keep = (samples >= 0) & (samples < (duration - 1.) * sfreq)
+    samples, descriptions = samples[keep], descriptions[keep]
+    if n_events is not None and len(samples) != n_events:
+        raise ValueError("{} events do not fit into {} s at {} Hz".format(
+            n_events, duration, sfreq))
+    onsets = samples / sfreq
+
+    def poisson_onsets(rate):
+        n = rng.poisson(rate * duration)
+        return np.sort(rng.uniform(0, duration, n)) if n else np.zeros(0)
+
+    # Alpha bursts (~0.3/s, 0.5-2 s long, 9-11 Hz) and blinks (~0.25/s).
+    burst_onsets = poisson_onsets(0.3)
+    bursts = dict(start=(burst_onsets * sfreq).astype(np.int64),
+                  length=(rng.uniform(0.5, 2., len(burst_onsets)) * sfreq).astype(np.int64),
+                  freq=rng.normal(10., 0.5, len(burst_onsets)),
+                  phase=rng.uniform(0, 2 * np.pi, len(burst_onsets)),
+                  amp=rng.uniform(10e-6, 25e-6, len(burst_onsets)))
+    blink_onsets = poisson_onsets(0.25)
+    blinks = dict(start=(blink_onsets * sfreq).astype(np.int64),
+                  amp=rng.uniform(80e-6, 200e-6, len(blink_onsets)))
+    erps = dict(start=samples[descriptions == 'Encoding'])
+
+    if n_bad is None:
+        n_bad = max(1, n_channels // 32)
+    candidates = [k for k, name in enumerate(ch_names) if name not in ('Fp1', 'Fp2')]
+    bad_idx = np.sort(rng.choice(candidates, size=min(n_bad, len(candidates)), replace=False))
+
+    return dict(
+        ch_names=ch_names, positions=positions, sfreq=float(sfreq), n_times=n_times,
+        line_freq=line_freq, eog=eog, seeds=seeds, bursts=bursts, blinks=blinks,
+        erps=erps, onsets=onsets, descriptions=list(descriptions),
+        bad_channels=[ch_names[k] for k in bad_idx], bad_idx=bad_idx,
+        bad_kind=np.where(np.arange(len(bad_idx)) % 2, 'flat', 'noisy'),
+        weights=dict(alpha=_spatial_weights(positions, 'POz', 0.15),
+                     blink=_spatial_weights(positions, 'Fpz', 0.08),
+                     erp=_spatial_weights(positions, 'Pz', 0.2)),
+    )
+
+
+# ------------------------------------------------------------------
+# Step 3: Block-by-Block Sample Generator
+# ------------------------------------------------------------------
+def _blink_template(sfreq):
+    tau = 0.1
+    t = np.arange(int(0.5 * sfreq)) / sfreq
+    return (t / tau) * np.exp(1 - t / tau)
+
+
+def _erp_template(sfreq):
+    # N1 (100 ms, negative) and P3 (300 ms, positive), 5 uV.
+    t = np.arange(int(0.8 * sfreq)) / sfreq
+    return 5e-6 * (-0.6 * np.exp(-((t - 0.1) / 0.03) ** 2) + np.exp(-((t - 0.3) / 0.08) ** 2))
+
+
+class SyntheticStream:
+    """
+    Sequential sample source for a recording from make_recording(). Data are
+    generated in fixed one-second blocks (so the output does not depend on
+    how it is read) and read() serves any [start, stop) range; reading
+    backwards restarts the generator from the beginning.
+    """
+
+    def __init__(self, recording):
+        self.rec = recording
+        self.sfreq = recording['sfreq']
+        self.block_size = max(1, int(self.sfreq))
+        self.n_channels = len(recording['ch_names']) + int(recording['eog'])
+        self._blink = _blink_template(self.sfreq)
+        self._erp = _erp_template(self.sfreq)
+        # Scale white noise so the pink background is ~10 uV RMS.
+        impulse = signal.lfilter(_PINK_B, _PINK_A, np.r_[1., np.zeros(20 * self.block_size)])
+        self._pink_gain = 10e-6 / np.sqrt(np.sum(impulse ** 2))
+        n_ch = len(recording['ch_names'])
+        rng = np.random.default_rng(recording['seeds'][1])
+        self._line_amp = rng.uniform(1e-6, 4e-6, n_ch)
+        self._line_phase = rng.uniform(0, 2 * np.pi, n_ch)
+        self.reset()
+
+    def reset(self):
+        rec = self.rec
+        self._noise_rng = np.random.default_rng(rec['seeds'][2])
+        n_ch = len(rec['ch_names'])
+        self._zi = np.zeros((n_ch, len(_PINK_A) - 1))
+        self._next_block = 0
+        self._cache_start, self._cache = None, None
+
+    def _events_in(self, starts, length, b0, b1):
+        lo = np.searchsorted(starts, b0 - length, side='right')
+        hi = np.searchsorted(starts, b1, side='left')
+        return range(lo, hi)
+
+    def _add_transient(self, out, b0, start, waveform, weights):
+        # Add waveform (starting at absolute sample ``start``) to out[:, b0:...].
+        lo, hi = max(start, b0), min(start + len(waveform), b0 + out.shape[1])
+        if lo < hi:
+            out[:, lo - b0:hi - b0] += np.outer(weights, waveform[lo - start:hi - start])
+
+    def _make_block(self, k):
+        rec, sfreq = self.rec, self.sfreq
+        b0 = k * self.block_size
+        n = min(self.block_size, rec['n_times'] - b0)
+        n_ch = len(rec['ch_names'])
+
+        # 1/f background, filter state carried from the previous block.
+        white = self._noise_rng.standard_normal((n_ch, n))
+        out, self._zi = signal.lfilter(_PINK_B, _PINK_A, white, axis=-1, zi=self._zi)
+        out *= self._pink_gain
+
+        # 50 Hz line noise, phase continuous in absolute time.
+        t = (b0 + np.arange(n)) / sfreq
+        out += self._line_amp[:, None] * np.sin(
+            2 * np.pi * rec['line_freq'] * t[None, :] + self._line_phase[:, None])
+
+        # Alpha bursts (posterior), ERPs after Encoding, blinks (frontal).
+        bursts = rec['bursts']
+        for i in self._events_in(bursts['start'], bursts['length'].max(initial=0), b0, b0 + n):
+            m = bursts['length'][i]
+            tt = np.arange(m) / sfreq
+            wave = bursts['amp'][i] * np.hanning(m) * np.sin(
+                2 * np.pi * bursts['freq'][i] * tt + bursts['phase'][i])
+            self._add_transient(out, b0, bursts['start'][i], wave, rec['weights']['alpha'])
+        for i in self._events_in(rec['erps']['start'], len(self._erp), b0, b0 + n):
+            self._add_transient(out, b0, rec['erps']['start'][i], self._erp,
+                                rec['weights']['erp'])
+        blink_part = np.zeros((1, n))
+        blinks = rec['blinks']
+        for i in self._events_in(blinks['start'], len(self._blink), b0, b0 + n):
+            self._add_transient(blink_part, b0, blinks['start'][i],
+                                blinks['amp'][i] * self._blink, np.ones(1))
+        out += rec['weights']['blink'][:, None] * blink_part
+
+        # Bad channels: 8x extra white noise, or (almost) flat.
+        for idx, kind in zip(rec['bad_idx'], rec['bad_kind']):
+            if kind == 'noisy':
+                out[idx] += 80e-6 * self._noise_rng.standard_normal(n)
+            else:
+                out[idx] = 0.1e-6 * self._noise_rng.standard_normal(n)
+
+        if rec['eog']:
+            eog = blink_part * 1.2 + 5e-6 * self._noise_rng.standard_normal((1, n))
+            out = np.concatenate([out, eog])
+        return out
+
+    def read(self, start, stop):
+        """Return samples [start, stop) as an (n_channels, stop - start) array."""
+        out = np.empty((self.n_channels, stop - start))
+        pos = start
+        while pos < stop:
+            k = pos // self.block_size
+            if self._cache_start != k:
+                if k < self._next_block:
+                    self.reset()
+                while self._next_block <= k:  # generate (and skip) up to block k
+                    block = self._make_block(self._next_block)
+                    self._next_block += 1
+                self._cache_start, self._cache = k, block
+            b0 = k * self.block_size
+            hi = min(stop, b0 + self._cache.shape[1])
+            out[:, pos - start:hi - start] = self._cache[:, pos - b0:hi - b0]
+            pos = hi
+        return out
+
+
+# ------------------------------------------------------------------
+# Step 4: Lazy Raw Object and FIF Output
+# ------------------------------------------------------------------
+def _make_info(recording):
+    import mne
+
+    ch_names = list(recording['ch_names'])
+    ch_types = ['eeg'] * len(ch_names)
+    if recording['eog']:
+        ch_names.append('EOG')
+        ch_types.append('eog')
+    info = mne.create_info(ch_names, recording['sfreq'], ch_types)
+    montage = mne.channels.make_dig_montage(
+        dict(zip(recording['ch_names'], recording['positions'])), coord_frame='head')
+    info.set_montage(montage)
+    with info._unlock():
+        info['line_freq'] = recording['line_freq']
+    return info
+
+
+def _annotations(recording):
+    import mne
+    return mne.Annotations(recording['onsets'], 0., recording['descriptions'])
+
+
+class RawSynthetic(BaseRaw):
+    """Lazy Raw whose samples come from a SyntheticStream."""
+
+    def __init__(self, recording):
+        super().__init__(_make_info(recording), preload=False,
+                         last_samps=[recording['n_times'] - 1],
+                         raw_extras=[dict(stream=SyntheticStream(recording))],
+                         orig_format='double', verbose=False)
+        self.recording = recording
+
+    def _read_segment_file(self, data, idx, fi, start, stop, cals, mult):
+        block = self._raw_extras[fi]['stream'].read(start, stop)
+        data[:] = block[idx] if mult is None else mult @ block
+
+
+def make_synthetic_raw(mark_bads=False, **kwargs):
+    """
+    Return a lazy (preload=False) Raw for a synthetic recording; arguments
+    as make_recording(). Samples are generated when read, so
+    raw.save('x_raw.fif') streams it to disk and raw.load_data() is only
+    needed when the data should live in memory.
+    """
+    recording = make_recording(**kwargs)
+    raw = RawSynthetic(recording)
+    raw.set_annotations(_annotations(recording))
+    if mark_bads:
+        raw.info['bads'] = list(recording['bad_channels'])
+    return raw
+
+
+def write_synthetic_fif(fname, overwrite=False, **kwargs):
+    """Stream a synthetic recording to a FIF file. Returns the recording."""
+    raw = make_synthetic_raw(**kwargs)
+    raw.save(fname, buffer_size_sec=10., overwrite=overwrite, verbose=False)
+    return raw.recording
+
+
+# ------------------------------------------------------------------
+# Step 5: Streaming EEGLAB (.set/.fdt) Output
+# ------------------------------------------------------------------
+def write_synthetic_eeglab(fname, chunk_duration=10., **kwargs):
+    """
+    Write a synthetic recording as EEGLAB ``fname`` (.set) plus the
+    matching .fdt, writing the samples chunk by chunk. Readable with
+    mne.io.read_raw_eeglab(). Returns the recording.
+    """
+    from scipy.io import savemat
+
+    recording = make_recording(**kwargs)
+    stream = SyntheticStream(recording)
+    sfreq, n_times = recording['sfreq'], recording['n_times']
+    fdt_fname = os.path.splitext(fname)[0] + '.fdt'
+    chunk = max(1, int(chunk_duration * sfreq))
+    # .fdt: float32 microvolts, all channels of sample 1, then sample 2, ...
+    with open(fdt_fname, 'wb') as fid:
+        for start in range(0, n_times, chunk):
+            stop = min(start + chunk, n_times)
+            block = (stream.read(start, stop) * 1e6).astype('<f4')
+            fid.write(block.T.tobytes())
+
+    # EEGLAB X points to the nose and Y to the left ear, in mm.
+    chanlocs = []
+    for name, pos in zip(recording['ch_names'], recording['positions']):
+        chanlocs.append(dict(labels=name, type='EEG', X=pos[1] * 1e3,
+                             Y=-pos[0] * 1e3, Z=pos[2] * 1e3))
+    if recording['eog']:
+        chanlocs.append(dict(labels='EOG', type='EOG', X=np.nan, Y=np.nan, Z=np.nan))
+    events = [dict(type=desc, latency=float(onset * sfreq + 1), duration=0.)
+              for onset, desc in zip(recording['onsets'], recording['descriptions'])]
+    eeg = dict(
+        setname='synthetic', filename=os.path.basename(fname), filepath='',
+        nbchan=float(len(chanlocs)), trials=1., pnts=float(n_times), srate=sfreq,
+        xmin=0., xmax=(n_times - 1) / sfreq, data=os.path.basename(fdt_fname),
+        chanlocs=np.array(chanlocs, dtype=object), event=np.array(events, dtype=object),
+        ref='common', icawinv=np.zeros((0, 0)), icasphere=np.zeros((0, 0)),
+        icaweights=np.zeros((0, 0)), icaact=np.zeros((0, 0)),
+    )
+    savemat(fname, dict(EEG=eeg), appendmat=False, oned_as='row')
+    return recording
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # ------------------------------------------------------------------
+    # Example: python mne_synthetic_data.py synth.set --n-channels 128 --duration 3600
+    # ------------------------------------------------------------------
+    parser = argparse.ArgumentParser(description='Write a synthetic EEG recording.')
+    parser.add_argument('fname', help='output file (.set for EEGLAB, .fif for FIF)')
+    parser.add_argument('--n-channels', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=600., help='seconds')
+    parser.add_argument('--sfreq', type=float, default=500.)
+    parser.add_argument('--n-events', type=int, default=None)
+    parser.add_argument('--eog', action='store_true', help='add an EOG channel')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = dict(n_channels=args.n_channels, duration=args.duration, sfreq=args.sfreq,
+                  n_events=args.n_events, eog=args.eog, seed=args.seed)
+    if args.fname.endswith('.set'):
+        recording = write_synthetic_eeglab(args.fname, **kwargs)
+    else:
+        recording = write_synthetic_fif(args.fname, overwrite=True, **kwargs)
+    print("Wrote", args.fname)
+    print("  channels:", len(recording['ch_names']), " samples:", recording['n_times'])
+    print("  annotations:", len(recording['onsets']), " bad channels:", recording['bad_channels'])